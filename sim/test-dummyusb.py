@@ -48,8 +48,8 @@ class UsbTest:
 
         # Set the signal "test_name" to match this test
         import inspect
-        tn = cocotb.binary.BinaryValue(value=None, n_bits=4096)
-        tn.buff = inspect.stack()[1][3]
+        tn = cocotb.binary.BinaryValue(value=None, n_bits=256)
+        tn.buff = inspect.stack()[1][3][:32]
         self.dut.test_name = tn
 
     @cocotb.coroutine
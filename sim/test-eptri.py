@@ -1,7 +1,8 @@
 # Tests for the Fomu Tri-Endpoint
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, NullTrigger, Timer
+from cocotb.triggers import RisingEdge, NullTrigger, Timer, First, ClockCycles
+from cocotb.utils import get_sim_time, get_sim_steps
 from cocotb.result import TestFailure, TestSuccess, ReturnValue
 
 from valentyusb.usbcore.utils.packet import *
@@ -11,8 +12,13 @@ from valentyusb.usbcore.utils.pprint import pp_packet
 
 from wishbone import WishboneMaster, WBOp
 
+import functools
+import itertools
 import logging
 import csv
+import os
+import sys
+import types
 
 def grouper_tofit(n, iterable):
     from itertools import zip_longest
@@ -33,24 +39,117 @@ def grouper_tofit(n, iterable):
         fixed.append(f)
     return fixed
 
+def parse_csr(csr_file):
+    csrs = dict()
+    with open(csr_file, newline='') as csr_csv_file:
+        csr_csv = csv.reader(csr_csv_file)
+        # csr_register format: csr_register, name, address, size, rw/ro
+        for row in csr_csv:
+            if row[0] == 'csr_register':
+                csrs[row[1]] = int(row[2], base=0)
+    return csrs
+
+@functools.lru_cache(maxsize=8)
+def _parse_csr_cached(csr_file, mtime):
+    # `mtime` is only part of the cache key, so that a regenerated
+    # csr.csv gets parsed again.  The result is shared between every
+    # UsbTest, so hand out a read-only view of it.
+    return types.MappingProxyType(parse_csr(csr_file))
+
+def _csr_accessors(adr):
+    async def write(self, val):
+        await self._wb_cycle(adr, 1, [val])
+
+    async def read(self):
+        value = await self._wb_cycle(adr, 0, [0])
+        return value[0]
+
+    return write, read
+
+@functools.lru_cache(maxsize=8)
+def _make_test_class(csr_file, mtime):
+    ns = {"csr_file": csr_file}
+    for name, addr in _parse_csr_cached(csr_file, mtime).items():
+        ns["write_" + name], ns["read_" + name] = _csr_accessors(addr >> 2)
+    return type("UsbTest_" + os.path.splitext(os.path.basename(csr_file))[0],
+                (UsbTest,), ns)
+
+def make_test_class(csr_file="csr.csv"):
+    """Return a subclass of UsbTest for the design described by `csr_file`.
+
+    The subclass has a ``write_<csr>(val)`` and ``read_<csr>()`` method for
+    every CSR, with the Wishbone address already bound, so CSR accesses
+    don't have to look the address up by name.
+    """
+    return _make_test_class(csr_file, os.path.getmtime(csr_file))
+
 class UsbTest:
+    """Test harness for the eptri DUT.
+
+    The harness uses the ``write_<csr>()`` and ``read_<csr>()`` accessors,
+    which only exist on the subclasses built by make_test_class().  Create
+    one with ``make_test_class(csr_file)(dut)`` rather than instantiating
+    this class directly.
+    """
+
+    # The CSR map the accessors were built from; set by make_test_class()
+    csr_file = None
+
+    # BinaryValues for the `test_name` signal, keyed by test name
+    _test_names = {}
+    # Name last written to `test_name`, which keeps its value between tests
+    _last_test_name = None
+
     def __init__(self, dut):
+        csr_file = self.csr_file
+        if csr_file is None:
+            raise TypeError("UsbTest has no CSR accessors; use make_test_class()(dut)")
         self.dut = dut
-        self.csrs = dict()
-        with open("csr.csv", newline='') as csr_csv_file:
-            csr_csv = csv.reader(csr_csv_file)
-            # csr_register format: csr_register, name, address, size, rw/ro
-            for row in csr_csv:
-                if row[0] == 'csr_register':
-                    self.csrs[row[1]] = int(row[2], base=0)
-        cocotb.fork(Clock(dut.clk48, 20800, 'ps').start())
+        self.csrs = _parse_csr_cached(csr_file, os.path.getmtime(csr_file))
+        self._clk48_period_ps = 20800
+        cocotb.fork(Clock(dut.clk48, self._clk48_period_ps, 'ps').start())
+        # Simulator steps per clk48 period, so packet timing can use the raw
+        # step count rather than converting units on every packet.
+        self._clk48_period_steps = get_sim_steps(self._clk48_period_ps, 'ps')
         self.wb = WishboneMaster(dut, "wishbone", dut.clk12, timeout=20)
 
-        # Set the signal "test_name" to match this test
-        import inspect
-        tn = cocotb.binary.BinaryValue(value=None, n_bits=4096)
-        tn.buff = inspect.stack()[1][3]
-        self.dut.test_name = tn
+        # CSR accesses are single-beat classic cycles, so drive the bus
+        # directly instead of going through WishboneMaster, which forks two
+        # helper coroutines per cycle that wake up on every clock edge.
+        self._wb_cyc = self.wb.bus.cyc
+        self._wb_stb = self.wb.bus.stb
+        self._wb_we = self.wb.bus.we
+        self._wb_adr = self.wb.bus.adr
+        self._wb_datwr = self.wb.bus.datwr
+        self._wb_datrd = self.wb.bus.datrd
+        self._wb_ack = self.wb.bus.ack
+        self._wb_timeout = 20
+
+        # The cycle type identifier isn't managed by WishboneMaster, so
+        # drive it ourselves for bursts.
+        self._wb_cti = dut.wishbone_cti
+        self._wb_cti.setimmediatevalue(0)
+
+        # The USB lines are driven and sampled once per clk48 cycle, so look
+        # the handles up once rather than through the DUT for every bit.
+        self._usb_d_p = dut.usb_d_p
+        self._usb_d_n = dut.usb_d_n
+        self._usb_tx_en = dut.usb_tx_en
+        self._clk48_edge = RisingEdge(dut.clk48)
+
+        # Set the signal "test_name" to match this test.  Only the calling
+        # frame is needed, so avoid inspect.stack(), which walks (and reads
+        # the source of) every frame on the stack.  `test_name` is 256 bits
+        # wide, so only the first 32 characters fit.
+        name = sys._getframe(1).f_code.co_name
+        if UsbTest._last_test_name != name:
+            tn = UsbTest._test_names.get(name)
+            if tn is None:
+                tn = cocotb.binary.BinaryValue(value=None, n_bits=256)
+                tn.buff = name[:32]
+                UsbTest._test_names[name] = tn
+            self.dut.test_name.value = tn
+            UsbTest._last_test_name = name
 
     @cocotb.coroutine
     def reset(self):
@@ -66,45 +165,84 @@ class UsbTest:
         yield self.disconnect()
 
         # Enable endpoint 0
-        yield self.write(self.csrs['usb_setup_ev_enable'], 0xff)
-        yield self.write(self.csrs['usb_in_ev_enable'], 0xff)
-        yield self.write(self.csrs['usb_out_ev_enable'], 0xff)
-
-        yield self.write(self.csrs['usb_setup_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_in_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_address'], 0)
-
-    @cocotb.coroutine
-    def write(self, addr, val):
-        yield self.wb.write(addr, val)
-
-    @cocotb.coroutine
-    def read(self, addr):
-        value = yield self.wb.read(addr)
-        raise ReturnValue(value)
+        yield self.write_usb_setup_ev_enable(0xff)
+        yield self.write_usb_in_ev_enable(0xff)
+        yield self.write_usb_out_ev_enable(0xff)
+
+        yield self.write_usb_setup_ev_pending(0xff)
+        yield self.write_usb_in_ev_pending(0xff)
+        yield self.write_usb_out_ev_pending(0xff)
+        yield self.write_usb_address(0)
+
+    async def _wb_cycle(self, adr, we, vals, burst=False):
+        """Run one Wishbone cycle to word address `adr`, with a beat for each
+        value in `vals`.
+
+        If `burst` is set, the beats are tagged as a constant-address burst,
+        which is how the FIFO-style CSRs such as ``IN_DATA`` are accessed.
+        Returns the data read on each beat.
+        """
+        clkedge = RisingEdge(self.dut.clk12)
+        await clkedge
+        self._wb_cyc <= 1
+        self._wb_we <= we
+        self._wb_adr <= adr
+        result = []
+        last = len(vals) - 1
+        for i, val in enumerate(vals):
+            self._wb_stb <= 1
+            self._wb_datwr <= val
+            if burst:
+                self._wb_cti <= (0b111 if i == last else 0b001)
+            for _ in range(self._wb_timeout):
+                await clkedge
+                if self._wb_ack.value:
+                    break
+            else:
+                raise TestFailure("Timeout of %u clock cycles reached when waiting for reply from slave" % self._wb_timeout)
+            result.append(int(self._wb_datrd))
+        self._wb_stb <= 0
+        self._wb_we <= 0
+        self._wb_cyc <= 0
+        self._wb_cti <= 0
+        await clkedge
+        return result
+
+    async def write(self, addr, val):
+        await self._wb_cycle(addr >> 2, 1, [val])
+
+    async def read(self, addr):
+        value = await self._wb_cycle(addr >> 2, 0, [0])
+        return value[0]
+
+    async def write_burst(self, addr, vals):
+        """Write each value in `vals` to `addr` within a single bus cycle."""
+        vals = list(vals)
+        if len(vals) < 2:
+            for val in vals:
+                await self.write(addr, val)
+            return
+        await self._wb_cycle(addr >> 2, 1, vals, burst=True)
 
     @cocotb.coroutine
     def connect(self):
-        USB_PULLUP_OUT = self.csrs['usb_pullup_out']
-        yield self.write(USB_PULLUP_OUT, 1)
+        yield self.write_usb_pullup_out(1)
 
     @cocotb.coroutine
     def clear_pending(self, epaddr):
         if EndpointType.epdir(epaddr) == EndpointType.IN:
             # Reset endpoint
             self.dut._log.info("Clearing IN_EV_PENDING")
-            yield self.write(self.csrs['usb_in_ctrl'], 0x20)
-            yield self.write(self.csrs['usb_in_ev_pending'], 0xff)
+            yield self.write_usb_in_ctrl(0x20)
+            yield self.write_usb_in_ev_pending(0xff)
         else:
             self.dut._log.info("Clearing OUT_EV_PENDING")
-            yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-            yield self.write(self.csrs['usb_out_ctrl'], 0x20)
+            yield self.write_usb_out_ev_pending(0xff)
+            yield self.write_usb_out_ctrl(0x20)
 
     @cocotb.coroutine
     def disconnect(self):
-        USB_PULLUP_OUT = self.csrs['usb_pullup_out']
-        yield self.write(USB_PULLUP_OUT, 0)
+        yield self.write_usb_pullup_out(0)
 
     def assertEqual(self, a, b, msg):
         if a != b:
@@ -121,37 +259,46 @@ class UsbTest:
             msg) % args)
 
     # Host->Device
+    # Line state (usb_d_p, usb_d_n) for each symbol in a wrapped packet
+    _line_states = {
+        '0': (0, 0), '_': (0, 0),   # SE0 - both lines pulled low
+        '1': (1, 1),                # SE1 - illegal, should never occur
+        '-': (1, 0), 'I': (1, 0),   # Idle
+        'J': (1, 0),
+        'K': (0, 1),
+    }
+
     @cocotb.coroutine
-    def _host_send_packet(self, packet):
-        """Send a USB packet."""
+    def _host_send_packets(self, *packets):
+        """Send USB packets back-to-back."""
 
         # Packet gets multiplied by 4x so we can send using the
         # usb48 clock instead of the usb12 clock.
-        packet = 'JJJJJJJJ' + wrap_packet(packet)
-        self.assertEqual('J', packet[-1], "Packet didn't end in J: "+packet)
-
-        for v in packet:
-            if v == '0' or v == '_':
-                # SE0 - both lines pulled low
-                self.dut.usb_d_p <= 0
-                self.dut.usb_d_n <= 0
-            elif v == '1':
-                # SE1 - illegal, should never occur
-                self.dut.usb_d_p <= 1
-                self.dut.usb_d_n <= 1
-            elif v == '-' or v == 'I':
-                # Idle
-                self.dut.usb_d_p <= 1
-                self.dut.usb_d_n <= 0
-            elif v == 'J':
-                self.dut.usb_d_p <= 1
-                self.dut.usb_d_n <= 0
-            elif v == 'K':
-                self.dut.usb_d_p <= 0
-                self.dut.usb_d_n <= 1
-            else:
+        stream = ''
+        for packet in packets:
+            packet = 'JJJJJJJJ' + wrap_packet(packet)
+            # A bare assert only builds the (long) message if the check fails.
+            assert packet[-1] == 'J', "Packet didn't end in J: " + packet
+            stream += packet
+
+        # Hold each line state for as many clk48 cycles as it lasts, rather
+        # than waking up on every edge.
+        d_p = self._usb_d_p
+        d_n = self._usb_d_n
+        clk48 = self.dut.clk48
+        for v, run in itertools.groupby(stream):
+            try:
+                p, n = self._line_states[v]
+            except KeyError:
                 raise TestFailure("Unknown value: %s" % v)
-            yield RisingEdge(self.dut.clk48)
+            d_p <= p
+            d_n <= n
+            yield ClockCycles(clk48, len(list(run)))
+
+    @cocotb.coroutine
+    def _host_send_packet(self, packet):
+        """Send a USB packet."""
+        yield self._host_send_packets(packet)
 
     @cocotb.coroutine
     def host_send_token_packet(self, pid, addr, ep):
@@ -174,16 +321,19 @@ class UsbTest:
     @cocotb.coroutine
     def host_send(self, data01, addr, epnum, data, expected=PID.ACK):
         """Send data out the virtual USB connection, including an OUT token"""
-        yield self.host_send_token_packet(PID.OUT, addr, epnum)
-        yield self.host_send_data_packet(data01, data)
+        assert data01 in (PID.DATA0, PID.DATA1), data01
+        yield self._host_send_packets(
+            token_packet(PID.OUT, addr, EndpointType.epnum(epnum)),
+            data_packet(data01, data))
         yield self.host_expect_packet(handshake_packet(expected), "Expected {} packet.".format(expected))
 
 
     @cocotb.coroutine
     def host_setup(self, addr, epnum, data):
         """Send data out the virtual USB connection, including a SETUP token"""
-        yield self.host_send_token_packet(PID.SETUP, addr, epnum)
-        yield self.host_send_data_packet(PID.DATA0, data)
+        yield self._host_send_packets(
+            token_packet(PID.SETUP, addr, EndpointType.epnum(epnum)),
+            data_packet(PID.DATA0, data))
         yield self.host_expect_ack()
 
     @cocotb.coroutine
@@ -199,7 +349,7 @@ class UsbTest:
         """Except to receive the following USB packet."""
 
         def current():
-            values = (self.dut.usb_d_p, self.dut.usb_d_n)
+            values = (self._usb_d_p, self._usb_d_n)
 
             if values == (0, 0):
                 return '_'
@@ -212,15 +362,19 @@ class UsbTest:
             else:
                 raise TestFailure("Unrecognized dut values: {}".format(values))
 
-        # Wait for transmission to start
-        tx = 0
+        # Wait for transmission to start.  The DUT drives usb_tx_en, so wait
+        # for its edge (or the timeout) instead of waking on every clk48 edge.
+        tx = self._usb_tx_en
         bit_times = 0
-        for i in range(0, 100):
-            tx = self.dut.usb_tx_en
+        if tx != 1:
+            start = get_sim_time()
+            yield First(RisingEdge(tx), ClockCycles(self.dut.clk48, 100))
             if tx == 1:
-                break
-            yield RisingEdge(self.dut.clk48)
-            bit_times = bit_times + 1
+                # usb_tx_en rises just after a clk48 edge, but the line state
+                # is sampled on the edges themselves.  Wait for the next edge
+                # so that capture starts where polling would have seen it.
+                yield self._clk48_edge
+            bit_times = -(-(get_sim_time() - start) // self._clk48_period_steps)
         if tx != 1:
             raise TestFailure("No packet started, " + msg)
 
@@ -238,8 +392,8 @@ class UsbTest:
         result = ""
         for i in range(0, 4096):
             result += current()
-            yield RisingEdge(self.dut.clk48)
-            if self.dut.usb_tx_en != 1:
+            yield self._clk48_edge
+            if tx != 1:
                 break
         if tx == 1:
             raise TestFailure("Packet didn't finish, " + msg)
@@ -271,10 +425,10 @@ class UsbTest:
     @cocotb.coroutine
     def pending(self, ep):
         if EndpointType.epdir(ep) == EndpointType.IN:
-            val = yield self.read(self.csrs['usb_in_status'])
+            val = yield self.read_usb_in_status()
             raise ReturnValue(val & (1 << 4))
         else:
-            val = yield self.read(self.csrs['usb_out_status'])
+            val = yield self.read_usb_out_status()
             raise ReturnValue((val & (1 << 5) | (1 << 4)) and (EndpointType.epnum(ep) == (val & 0x0f)))
 
     @cocotb.coroutine
@@ -283,7 +437,7 @@ class UsbTest:
         # wait for data to appear
         for i in range(128):
             self.dut._log.debug("Prime loop {}".format(i))
-            status = yield self.read(self.csrs['usb_setup_status'])
+            status = yield self.read_usb_setup_status()
             have = status & 0x10
             if have:
                 break
@@ -291,11 +445,11 @@ class UsbTest:
 
         for i in range(48):
             self.dut._log.debug("Read loop {}".format(i))
-            status = yield self.read(self.csrs['usb_setup_status'])
+            status = yield self.read_usb_setup_status()
             have = status & 0x10
             if not have:
                 break
-            v = yield self.read(self.csrs['usb_setup_data'])
+            v = yield self.read_usb_setup_data()
             actual_data.append(v)
             yield RisingEdge(self.dut.clk12)
 
@@ -308,37 +462,37 @@ class UsbTest:
         self.assertSequenceEqual(crc16(expected_data), actual_crc16, "CRC16 not valid")
 
         # Acknowledge that we've handled the setup packet
-        yield self.write(self.csrs['usb_setup_ctrl'], 2)
+        yield self.write_usb_setup_ctrl(2)
 
     @cocotb.coroutine
     def drain_setup(self):
         actual_data = []
         for i in range(48):
-            status = yield self.read(self.csrs['usb_setup_status'])
+            status = yield self.read_usb_setup_status()
             have = status & 0x10
             if not have:
                 break
-            v = yield self.read(self.csrs['usb_setup_data'])
+            v = yield self.read_usb_setup_data()
             actual_data.append(v)
             yield RisingEdge(self.dut.clk12)
-        yield self.write(self.csrs['usb_setup_ctrl'], 2)
+        yield self.write_usb_setup_ctrl(2)
         # Drain the pending bit
-        yield self.write(self.csrs['usb_setup_ev_pending'], 0xff)
+        yield self.write_usb_setup_ev_pending(0xff)
         return actual_data
 
     @cocotb.coroutine
     def drain_out(self):
         actual_data = []
         for i in range(70):
-            status = yield self.read(self.csrs['usb_out_status'])
+            status = yield self.read_usb_out_status()
             have = status & (1 << 4)
             if not have:
                 break
-            v = yield self.read(self.csrs['usb_out_data'])
+            v = yield self.read_usb_out_data()
             actual_data.append(v)
             yield RisingEdge(self.dut.clk12)
-        yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_out_ctrl'], 0x10)
+        yield self.write_usb_out_ev_pending(0xff)
+        yield self.write_usb_out_ctrl(0x10)
         return actual_data[:-2] # Strip off CRC16
 
     @cocotb.coroutine
@@ -347,7 +501,7 @@ class UsbTest:
         # wait for data to appear
         for i in range(128):
             self.dut._log.debug("Prime loop {}".format(i))
-            status = yield self.read(self.csrs['usb_out_status'])
+            status = yield self.read_usb_out_status()
             have = status & (1 << 4)
             if have:
                 break
@@ -355,11 +509,11 @@ class UsbTest:
 
         for i in range(256):
             self.dut._log.debug("Read loop {}".format(i))
-            status = yield self.read(self.csrs['usb_out_status'])
+            status = yield self.read_usb_out_status()
             have = status & (1 << 4)
             if not have:
                 break
-            v = yield self.read(self.csrs['usb_out_data'])
+            v = yield self.read_usb_out_data()
             actual_data.append(v)
             yield RisingEdge(self.dut.clk12)
 
@@ -371,23 +525,22 @@ class UsbTest:
             self.print_ep(epaddr, "Got: %r (expected: %r)", actual_data, expected_data)
             self.assertSequenceEqual(expected_data, actual_data, "DATA packet not correctly received")
             self.assertSequenceEqual(crc16(expected_data), actual_crc16, "CRC16 not valid")
-            pending = yield self.read(self.csrs['usb_out_ev_pending'])
+            pending = yield self.read_usb_out_ev_pending()
             if pending != 1:
                 raise TestFailure('event not generated')
-            yield self.write(self.csrs['usb_out_ev_pending'], pending)
+            yield self.write_usb_out_ev_pending(pending)
 
     @cocotb.coroutine
     def set_response(self, ep, response):
         if EndpointType.epdir(ep) == EndpointType.IN and response == EndpointResponse.ACK:
-            yield self.write(self.csrs['usb_in_ctrl'], EndpointType.epnum(ep))
+            yield self.write_usb_in_ctrl(EndpointType.epnum(ep))
         elif EndpointType.epdir(ep) == EndpointType.OUT and response == EndpointResponse.ACK:
-            yield self.write(self.csrs['usb_out_ctrl'], 0x10 | EndpointType.epnum(ep))
+            yield self.write_usb_out_ctrl(0x10 | EndpointType.epnum(ep))
 
     @cocotb.coroutine
     def send_data(self, token, ep, data):
-        for b in data:
-            yield self.write(self.csrs['usb_in_data'], b)
-        yield self.write(self.csrs['usb_in_ctrl'], EndpointType.epnum(ep) & 0x0f)
+        yield self.write_burst(self.csrs['usb_in_data'], data)
+        yield self.write_usb_in_ctrl(EndpointType.epnum(ep) & 0x0f)
 
     @cocotb.coroutine
     def transaction_setup(self, addr, data, epnum=0):
@@ -422,9 +575,8 @@ class UsbTest:
         for i, chunk in enumerate(grouper_tofit(chunk_size, data)):
             sent_data = 1
             self.dut._log.debug("Actual data we're expecting: {}".format(chunk))
-            for b in chunk:
-                yield self.write(self.csrs['usb_in_data'], b)
-            yield self.write(self.csrs['usb_in_ctrl'], epnum)
+            yield self.write_burst(self.csrs['usb_in_data'], chunk)
+            yield self.write_usb_in_ctrl(epnum)
             recv = cocotb.fork(self.host_recv(datax, addr, ep, chunk))
             yield recv.join()
 
@@ -433,7 +585,7 @@ class UsbTest:
             else:
                 datax = PID.DATA0
         if not sent_data:
-            yield self.write(self.csrs['usb_in_ctrl'], epnum)
+            yield self.write_usb_in_ctrl(epnum)
             recv = cocotb.fork(self.host_recv(datax, addr, ep, []))
             yield self.send_data(datax, epnum, data)
             yield recv.join()
@@ -441,8 +593,7 @@ class UsbTest:
     @cocotb.coroutine
     def set_data(self, ep, data):
         _epnum = EndpointType.epnum(ep)
-        for b in data:
-            yield self.write(self.csrs['usb_in_data'], b)
+        yield self.write_burst(self.csrs['usb_in_data'], data)
 
     @cocotb.coroutine
     def transaction_status_in(self, addr, ep):
@@ -466,7 +617,7 @@ class UsbTest:
         if (setup_data[0] & 0x80) == 0x80:
             raise Exception("setup_data indicated an IN transfer, but you requested an OUT transfer")
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = yield self.read_usb_setup_ev_pending()
         if setup_ev != 0:
             raise TestFailure("setup_ev should be 0 at the start of the test, was: {:02x}".format(setup_ev))
 
@@ -474,14 +625,14 @@ class UsbTest:
         self.dut._log.info("setup stage")
         yield self.transaction_setup(addr, setup_data)
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = yield self.read_usb_setup_ev_pending()
         if setup_ev != 1:
             raise TestFailure("setup_ev should be 1, was: {:02x}".format(setup_ev))
-        yield self.write(self.csrs['usb_setup_ev_pending'], setup_ev)
+        yield self.write_usb_setup_ev_pending(setup_ev)
 
         # Data stage
         if descriptor_data is not None:
-            out_ev = yield self.read(self.csrs['usb_out_ev_pending'])
+            out_ev = yield self.read_usb_out_ev_pending()
             if out_ev != 0:
                 raise TestFailure("out_ev should be 0 at the start of the test, was: {:02x}".format(out_ev))
         if (setup_data[7] != 0 or setup_data[6] != 0) and descriptor_data is None:
@@ -497,18 +648,18 @@ class UsbTest:
 
         # Status stage
         self.dut._log.info("status stage")
-        yield self.write(self.csrs['usb_in_ctrl'], 0) # Send an empty IN packet
-        in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
+        yield self.write_usb_in_ctrl(0) # Send an empty IN packet
+        in_ev = yield self.read_usb_in_ev_pending()
         if in_ev != 0:
             raise TestFailure("o: in_ev should be 0 at the start of the test, was: {:02x}".format(in_ev))
         yield self.transaction_status_in(addr, epaddr_in)
         yield RisingEdge(self.dut.clk12)
         yield RisingEdge(self.dut.clk12)
-        in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
+        in_ev = yield self.read_usb_in_ev_pending()
         if in_ev != 1:
             raise TestFailure("o: in_ev should be 1 at the end of the test, was: {:02x}".format(in_ev))
-        yield self.write(self.csrs['usb_in_ev_pending'], in_ev)
-        yield self.write(self.csrs['usb_in_ctrl'], 1 << 5) # Reset the IN buffer
+        yield self.write_usb_in_ev_pending(in_ev)
+        yield self.write_usb_in_ctrl(1 << 5) # Reset the IN buffer
 
     @cocotb.coroutine
     def control_transfer_in(self, addr, setup_data, descriptor_data=None):
@@ -518,7 +669,7 @@ class UsbTest:
         if (setup_data[0] & 0x80) == 0x00:
             raise Exception("setup_data indicated an OUT transfer, but you requested an IN transfer")
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = yield self.read_usb_setup_ev_pending()
         if setup_ev != 0:
             raise TestFailure("setup_ev should be 0 at the start of the test, was: {:02x}".format(setup_ev))
 
@@ -526,13 +677,13 @@ class UsbTest:
         self.dut._log.info("setup stage")
         yield self.transaction_setup(addr, setup_data)
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = yield self.read_usb_setup_ev_pending()
         if setup_ev != 1:
             raise TestFailure("setup_ev should be 1, was: {:02x}".format(setup_ev))
-        yield self.write(self.csrs['usb_setup_ev_pending'], setup_ev)
+        yield self.write_usb_setup_ev_pending(setup_ev)
 
         # Data stage
-        in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
+        in_ev = yield self.read_usb_in_ev_pending()
         if in_ev != 0:
             raise TestFailure("in_ev should be 0 at the start of the test, was: {:02x}".format(in_ev))
         if (setup_data[7] != 0 or setup_data[6] != 0) and descriptor_data is None:
@@ -546,29 +697,29 @@ class UsbTest:
             # Give the signal two clock cycles to percolate through the event manager
             yield RisingEdge(self.dut.clk12)
             yield RisingEdge(self.dut.clk12)
-            in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
+            in_ev = yield self.read_usb_in_ev_pending()
             if in_ev != 1:
                 raise TestFailure("in_ev should be 1 at the end of the test, was: {:02x}".format(in_ev))
-            yield self.write(self.csrs['usb_in_ev_pending'], in_ev)
+            yield self.write_usb_in_ev_pending(in_ev)
 
         # Status stage
-        yield self.write(self.csrs['usb_out_ctrl'], 0x10) # Send empty packet
+        yield self.write_usb_out_ctrl(0x10) # Send empty packet
         self.dut._log.info("status stage")
-        out_ev = yield self.read(self.csrs['usb_out_ev_pending'])
+        out_ev = yield self.read_usb_out_ev_pending()
         if out_ev != 0:
             raise TestFailure("i: out_ev should be 0 at the start of the test, was: {:02x}".format(out_ev))
         yield self.transaction_status_out(addr, epaddr_out)
         yield RisingEdge(self.dut.clk12)
-        out_ev = yield self.read(self.csrs['usb_out_ev_pending'])
+        out_ev = yield self.read_usb_out_ev_pending()
         if out_ev != 1:
             raise TestFailure("i: out_ev should be 1 at the end of the test, was: {:02x}".format(out_ev))
-        yield self.write(self.csrs['usb_out_ctrl'], 0x20) # Reset FIFO
-        yield self.write(self.csrs['usb_out_ev_pending'], out_ev)
+        yield self.write_usb_out_ctrl(0x20) # Reset FIFO
+        yield self.write_usb_out_ev_pending(out_ev)
 
 @cocotb.test()
 def iobuf_validate(dut):
     """Sanity test that the Wishbone bus actually works"""
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     USB_PULLUP_OUT = harness.csrs['usb_pullup_out']
@@ -587,22 +738,22 @@ def iobuf_validate(dut):
 
 @cocotb.test()
 def test_control_setup(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
     # We write to address 0, because we just want to test that the control
     # circuitry works.  Normally you wouldn't do this.
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
     yield harness.transaction_setup(0, [0x80, 0x06, 0x00, 0x06, 0x00, 0x00, 0x00, 0x00])
     yield harness.transaction_data_in(0, 0, [])
 
 @cocotb.test()
 def test_control_transfer_in(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 20)
+    yield harness.write_usb_address(20)
     yield harness.control_transfer_in(
         20,
         # Get descriptor, Index 0, Type 03, LangId 0000, wLength 10?
@@ -614,13 +765,13 @@ def test_control_transfer_in(dut):
 
 @cocotb.test()
 def test_control_transfer_in_data_out(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     ep3_out = EndpointType.epaddr(3, EndpointType.OUT)
     ep3_in = EndpointType.epaddr(3, EndpointType.IN)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
     yield harness.control_transfer_in(
         0,
         # Get descriptor, Index 0, Type 03, LangId 0000, wLength 10?
@@ -640,11 +791,11 @@ def test_control_transfer_in_lazy(dut):
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 ### SETUP packet
     harness.dut._log.info("sending initial SETUP packet")
     # Send a SETUP packet without draining it on the device side
@@ -655,8 +806,7 @@ def test_control_transfer_in_lazy(dut):
     # Set it up so we ACK the final IN packet
     data = [0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07,
             0x08, 0x09, 0x0A, 0x0B]
-    for b in data:
-        yield harness.write(harness.csrs['usb_in_data'], b)
+    yield harness.write_burst(harness.csrs['usb_in_data'], data)
 
     # Send a few packets while we "process" the data as a slow host
     for i in range(2):
@@ -664,7 +814,7 @@ def test_control_transfer_in_lazy(dut):
         yield harness.host_expect_nak()
 
     # Queue the IN response packet
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0)
+    yield harness.write_usb_in_ctrl(0)
 
     # Read the data
     setup_data = yield harness.drain_setup()
@@ -720,7 +870,7 @@ def test_control_transfer_in_lazy(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0x40) # Set STALL
+    yield harness.write_usb_in_ctrl(0x40) # Set STALL
 
     # Perform the final "read"
     yield harness.host_send_token_packet(PID.IN, 0, 0)
@@ -733,7 +883,7 @@ def test_control_transfer_in_lazy(dut):
     yield harness.host_send_data_packet(PID.DATA0, [0x80, 0x06, 0x00, 0x06, 0x00, 0x00, 0x0A, 0x00])
     # yield harness.host_expect_ack()
 
-    yield harness.write(harness.csrs['usb_address'], 11)
+    yield harness.write_usb_address(11)
 
 ### SETUP packet without draining
     harness.dut._log.info("sending a packet without draining SETUP")
@@ -745,8 +895,7 @@ def test_control_transfer_in_lazy(dut):
     # Set it up so we ACK the final IN packet
     data = [0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07,
             0x08, 0x09, 0x0A, 0x0B]
-    for b in data:
-        yield harness.write(harness.csrs['usb_in_data'], b)
+    yield harness.write_burst(harness.csrs['usb_in_data'], data)
 
     # Send a few packets while we "process" the data as a slow host
     for i in range(2):
@@ -758,7 +907,7 @@ def test_control_transfer_in_lazy(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("3. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0)
+    yield harness.write_usb_in_ctrl(0)
 
     # Perform the final send
     yield harness.host_send_token_packet(PID.IN, 11, 0)
@@ -777,15 +926,15 @@ def test_control_transfer_out_lazy(dut):
     ep3_in = EndpointType.epaddr(3, EndpointType.IN)
     ep3_data = [9, 5, 3, 2]
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 ### SETUP packet
 
     # Set it up so that we can ack EP0 and EP3
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x13) # Enable EP3
+    yield harness.write_usb_out_ctrl(0x13) # Enable EP3
 
     harness.dut._log.info("sending initial SETUP packet")
     # Send a SETUP packet without draining it on the device side
@@ -796,8 +945,7 @@ def test_control_transfer_out_lazy(dut):
     # Set it up so we ACK the final IN packet
     data = [0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07,
             0x08, 0x09, 0x0A, 0x0B]
-    for b in data:
-        yield harness.write(harness.csrs['usb_in_data'], b)
+    yield harness.write_burst(harness.csrs['usb_in_data'], data)
 
     # Send a few packets while we "process" the data as a slow host
     harness.dut._log.info("\"processing\" data on a slow host (should send NAKs)")
@@ -806,7 +954,7 @@ def test_control_transfer_out_lazy(dut):
         yield harness.host_expect_nak()
 
     # Queue the response packet for transmission
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0)
+    yield harness.write_usb_in_ctrl(0)
 
     # Read the data, which drains it out of the SETUP buffer
     setup_data = yield harness.drain_setup()
@@ -829,7 +977,7 @@ def test_control_transfer_out_lazy(dut):
     yield harness.host_expect_nak()
 
     harness.dut._log.info("draining OUT buffer")
-    out_status = yield harness.read(harness.csrs['usb_out_status'])
+    out_status = yield harness.read_usb_out_status()
     if (out_status & 0x20) == 0:
         raise TestFailure("out_status didn't have any pending event")
     if (out_status & 0x10) == 0:
@@ -843,7 +991,7 @@ def test_control_transfer_out_lazy(dut):
     yield harness.host_send_token_packet(PID.OUT, 0, ep3_out)
     yield harness.host_send_data_packet(PID.DATA0, ep3_data)
     yield harness.host_expect_ack()
-    out_status = yield harness.read(harness.csrs['usb_out_status'])
+    out_status = yield harness.read_usb_out_status()
     if (out_status & 0x20) == 0:
         raise TestFailure("out_status didn't have any pending event")
     if (out_status & 0x10) == 0:
@@ -860,11 +1008,11 @@ def test_control_transfer_in_large(dut):
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
     # Set address to 11
     yield harness.control_transfer_out(
@@ -874,7 +1022,7 @@ def test_control_transfer_in_large(dut):
         # 18 byte descriptor, max packet size 8 bytes
         None,
     )
-    yield harness.write(harness.csrs['usb_address'], 11)
+    yield harness.write_usb_address(11)
 
     ### Send a packet that's longer than 64 bytes
     string_data = [
@@ -906,9 +1054,8 @@ def test_control_transfer_in_large(dut):
     for i, chunk in enumerate(grouper_tofit(64, string_data)):
         sent_data = 1
         harness.dut._log.debug("Actual data we're expecting: {}".format(chunk))
-        for b in chunk:
-            yield harness.write(harness.csrs['usb_in_data'], b)
-        yield harness.write(harness.csrs['usb_in_ctrl'], 0)
+        yield harness.write_burst(harness.csrs['usb_in_data'], chunk)
+        yield harness.write_usb_in_ctrl(0)
         recv = cocotb.fork(harness.host_recv(datax, 11, 0, chunk))
         yield recv.join()
 
@@ -922,7 +1069,7 @@ def test_control_transfer_in_large(dut):
         else:
             datax = PID.DATA0
     if not sent_data:
-        yield harness.write(harness.csrs['usb_in_ctrl'], 0)
+        yield harness.write_usb_in_ctrl(0)
         recv = cocotb.fork(harness.host_recv(datax, 11, 0, []))
         yield harness.send_data(datax, 0, string_data)
         yield recv.join()
@@ -935,7 +1082,7 @@ def test_control_transfer_in_large(dut):
 
 @cocotb.test()
 def test_sof_stuffing(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
@@ -946,14 +1093,14 @@ def test_sof_stuffing(dut):
 
 @cocotb.test()
 def test_sof_is_ignored(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 0
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
 
     data = [0, 1, 8, 0, 4, 3, 0, 0]
     @cocotb.coroutine
@@ -979,7 +1126,7 @@ def test_sof_is_ignored(dut):
         yield harness.host_send_sof(4)
 
     # Indicate that we're ready to receive data to EP0
-    # harness.write(harness.csrs['usb_in_ctrl'], 0)
+    # harness.write_usb_in_ctrl(0)
 
     xmit = cocotb.fork(send_setup_and_sof())
     yield harness.expect_setup(epaddr_out, data)
@@ -992,13 +1139,13 @@ def test_sof_is_ignored(dut):
 
 @cocotb.test()
 def test_control_setup_clears_stall(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 28
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
     yield harness.host_send_sof(0)
 
     d = [0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0, 0]
@@ -1014,7 +1161,7 @@ def test_control_setup_clears_stall(dut):
 
     # STALL the endpoint now
     harness.dut._log.info("stalling EP0 IN")
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0x40)
+    yield harness.write_usb_in_ctrl(0x40)
 
     # Do another receive, which should fail
     harness.dut._log.info("next transaction should stall")
@@ -1032,12 +1179,12 @@ def test_control_setup_clears_stall(dut):
 
 @cocotb.test()
 def test_control_transfer_in_nak_data(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 22
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
     # Get descriptor, Index 0, Type 03, LangId 0000, wLength 64
     setup_data = [0x80, 0x06, 0x00, 0x03, 0x00, 0x00, 0x40, 0x00]
     in_data = [0x04, 0x03, 0x09, 0x04]
@@ -1045,7 +1192,7 @@ def test_control_transfer_in_nak_data(dut):
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
     # yield harness.clear_pending(epaddr_in)
 
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
 
     # Setup stage
     # -----------
@@ -1065,7 +1212,7 @@ def test_control_transfer_in_nak_data(dut):
 
 # @cocotb.test()
 # def test_control_transfer_in_nak_status(dut):
-#     harness = UsbTest(dut)
+#     harness = make_test_class()(dut)
 #     yield harness.reset()
 #     yield harness.connect()
 
@@ -1106,13 +1253,13 @@ def test_control_transfer_in_nak_data(dut):
 
 @cocotb.test()
 def test_control_transfer_in(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.OUT))
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.IN))
-    yield harness.write(harness.csrs['usb_address'], 20)
+    yield harness.write_usb_address(20)
     yield harness.host_send_sof(0)
 
     yield harness.control_transfer_in(
@@ -1126,13 +1273,13 @@ def test_control_transfer_in(dut):
 
 @cocotb.test()
 def test_control_transfer_in_out(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.OUT))
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.IN))
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
     yield harness.control_transfer_in(
         0,
@@ -1156,13 +1303,13 @@ def test_control_transfer_in_out(dut):
 @cocotb.test()
 def test_control_transfer_in_out_in(dut):
     """This transaction is pretty much the first thing any OS will do"""
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.OUT))
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.IN))
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
     yield harness.control_transfer_in(
         0,
@@ -1182,7 +1329,7 @@ def test_control_transfer_in_out_in(dut):
         None,
     )
 
-    yield harness.write(harness.csrs['usb_address'], 11)
+    yield harness.write_usb_address(11)
 
     yield harness.control_transfer_in(
         11,
@@ -1196,13 +1343,13 @@ def test_control_transfer_in_out_in(dut):
 
 @cocotb.test()
 def test_control_transfer_out_in(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.OUT))
     yield harness.clear_pending(EndpointType.epaddr(0, EndpointType.IN))
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
     yield harness.control_transfer_out(
         0,
@@ -1212,7 +1359,7 @@ def test_control_transfer_out_in(dut):
         None,
     )
 
-    yield harness.write(harness.csrs['usb_address'], 20)
+    yield harness.write_usb_address(20)
 
     yield harness.control_transfer_in(
         20,
@@ -1232,14 +1379,14 @@ def test_control_transfer_out_nak_data(dut):
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
     # Enable OUT endpoint
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x10)
+    yield harness.write_usb_out_ctrl(0x10)
 
 ### SET ADDRESS
     harness.dut._log.info("setting address")
@@ -1257,15 +1404,15 @@ def test_control_transfer_out_nak_data(dut):
     if len(setup_data) != 10:
         raise TestFailure("2. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), data, len(setup_data), len(setup_data) != 10))
     # Note: the `out` buffer hasn't been drained yet
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0) # Respond ACK to this packet
+    yield harness.write_usb_in_ctrl(0) # Respond ACK to this packet
     yield harness.host_send_token_packet(PID.IN, 0, 0)
     yield harness.host_expect_data_packet(PID.DATA1, [])
     yield harness.host_send_ack()
-    yield harness.write(harness.csrs['usb_address'], 11)
+    yield harness.write_usb_address(11)
 
 ### GET STATUS
     harness.dut._log.info("getting status")
-    yield harness.write(harness.csrs['usb_in_ev_pending'], 0xff)
+    yield harness.write_usb_in_ev_pending(0xff)
     harness.dut._log.info("sending DFU GET_STATUS command")
     yield harness.control_transfer_in(11,
         [0xA1, 0x03, 0x00, 0x00, 0x00, 0x00, 0x06, 0x00],
@@ -1293,7 +1440,7 @@ def test_control_transfer_out_nak_data(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x10) # Enable response on OUT EP
+    yield harness.write_usb_out_ctrl(0x10) # Enable response on OUT EP
 
     # Perform the final "write"
     yield harness.host_send_token_packet(PID.OUT, 11, 0)
@@ -1339,13 +1486,13 @@ def test_control_transfer_out_nak_data(dut):
 
 @cocotb.test()
 def test_in_transfer(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 0
     epaddr = EndpointType.epaddr(1, EndpointType.IN)
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
 
     d = [0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8]
 
@@ -1371,7 +1518,7 @@ def test_in_transfer(dut):
 
 @cocotb.test()
 def test_out_transfer(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
     ep0 = EndpointType.epaddr(0, EndpointType.OUT)
@@ -1383,7 +1530,7 @@ def test_out_transfer(dut):
     yield harness.host_send_token_packet(PID.SETUP, 0, ep0)
     yield harness.host_send_data_packet(PID.DATA0, [0x00, 0x05, addr, 0x00, 0x00, 0x00, 0x00, 0x00])
     yield harness.host_expect_ack()
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
 
     d = [0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0x8]
 
@@ -1424,13 +1571,13 @@ def test_out_transfer(dut):
 
 @cocotb.test()
 def test_in_transfer_stuff_last(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 0
     epaddr = EndpointType.epaddr(1, EndpointType.IN)
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
 
     d = [0x37, 0x75, 0x00, 0xe0]
 
@@ -1444,12 +1591,12 @@ def test_in_transfer_stuff_last(dut):
 
 @cocotb.test()
 def test_debug_in(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 0
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
     # The "scratch" register defaults to 0x12345678 at boot.
     reg_addr = harness.csrs['ctrl_scratch']
     setup_data = [0xc3, 0x00,
@@ -1482,7 +1629,7 @@ def test_debug_in(dut):
 
 # @cocotb.test()
 # def test_debug_in_missing_ack(dut):
-#     harness = UsbTest(dut)
+#     harness = make_test_class()(dut)
 #     yield harness.reset()
 #     yield harness.connect()
 
@@ -1517,12 +1664,12 @@ def test_debug_in(dut):
 
 @cocotb.test()
 def test_debug_out(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
     addr = 0
-    yield harness.write(harness.csrs['usb_address'], addr)
+    yield harness.write_usb_address(addr)
     reg_addr = harness.csrs['ctrl_scratch']
     setup_data = [0x43, 0x00,
                     (reg_addr >> 0) & 0xff,
@@ -1566,7 +1713,7 @@ def test_stall_in(dut):
     epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
     epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
@@ -1595,7 +1742,7 @@ def test_stall_in(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0x40) # Set STALL
+    yield harness.write_usb_in_ctrl(0x40) # Set STALL
 
     # Perform the final "read"
     yield harness.host_send_token_packet(PID.IN, 0, 0)
@@ -1617,7 +1764,7 @@ def test_stall_in(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_in_ctrl'], 0x40) # Set STALL
+    yield harness.write_usb_in_ctrl(0x40) # Set STALL
 
     # Perform the final "read"
     yield harness.host_send_token_packet(PID.IN, 0, 0)
@@ -1644,7 +1791,7 @@ def test_stall_out(dut):
     d = [0x12, 0x01, 0x10, 0x02, 0x02, 0x00, 0x00, 0x40,
             0x09, 0x12]
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
@@ -1674,7 +1821,7 @@ def test_stall_out(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x40) # Set STALL
+    yield harness.write_usb_out_ctrl(0x40) # Set STALL
 
     # Perform the final "read"
     yield harness.host_send_token_packet(PID.OUT, 0, 0)
@@ -1698,7 +1845,7 @@ def test_stall_out(dut):
     setup_data = yield harness.drain_setup()
     if len(setup_data) != 10:
         raise TestFailure("1. expected setup data to be 10 bytes, but was {} bytes: {}".format(len(setup_data), setup_data))
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x40) # Set STALL
+    yield harness.write_usb_out_ctrl(0x40) # Set STALL
 
     # Perform the final "read"
     yield harness.host_send_token_packet(PID.OUT, 0, 0)
@@ -1720,12 +1867,12 @@ def test_stall_out(dut):
 
 @cocotb.test()
 def test_reset(dut):
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
     yield harness.connect()
 
-    yield harness.write(harness.csrs['usb_address'], 23)
-    val = yield harness.read(harness.csrs['usb_address'])
+    yield harness.write_usb_address(23)
+    val = yield harness.read_usb_address()
     if val != 23:
         raise TestFailure("usb address should have been 23, but was {}".format(val))
 
@@ -1740,7 +1887,7 @@ def test_reset(dut):
     for i in range(0, 64):
         yield RisingEdge(harness.dut.clk12)
 
-    val = yield harness.read(harness.csrs['usb_address'])
+    val = yield harness.read_usb_address()
     if val != 0:
         raise TestFailure("after reset, usb address should have been 0, but was {}".format(val))
 
@@ -1755,15 +1902,15 @@ def out_nak_different_ep(dut):
     epaddr_d_out = EndpointType.epaddr(3, EndpointType.OUT)
     epaddr__in = EndpointType.epaddr(3, EndpointType.IN)
 
-    harness = UsbTest(dut)
+    harness = make_test_class()(dut)
     yield harness.reset()
 
     yield harness.connect()
-    yield harness.write(harness.csrs['usb_address'], 0)
+    yield harness.write_usb_address(0)
 
 ### Enable OUT endpoint
     harness.dut._log.info("enabling OUT endpoint")
-    yield harness.write(harness.csrs['usb_out_ctrl'], 0x10)
+    yield harness.write_usb_out_ctrl(0x10)
 
 ### SEND FIRST PACKET
     harness.dut._log.info("sending first packet")
@@ -1782,7 +1929,7 @@ def out_nak_different_ep(dut):
 
 ### VERIFY DEVICE SEES CORRECT EP NUMBER
     harness.dut._log.info("verifying device sees correct ep number")
-    incoming_ep = yield harness.read(harness.csrs['usb_out_status'])
+    incoming_ep = yield harness.read_usb_out_status()
     if (incoming_ep & 0xf) != 3:
         raise TestFailure("incorrect first-stage incoming EP.  Expected 3, got: {} (status: {:02x})".format(incoming_ep & 0xf, incoming_ep))
 
@@ -1795,6 +1942,6 @@ def out_nak_different_ep(dut):
 
 ### VERIFY DEVICE STILL SEES CORRECT ADDRESS
     harness.dut._log.info("verifying device still sees correct address")
-    incoming_ep = yield harness.read(harness.csrs['usb_out_status'])
+    incoming_ep = yield harness.read_usb_out_status()
     if (incoming_ep & 0xf) != 3:
         raise TestFailure("incorrect first-stage incoming EP.  Expected 3, got: {} (status: {:02x})".format(incoming_ep & 0xf, incoming_ep))
@@ -128,7 +128,7 @@ class WishboneMaster(Wishbone):
         self._acked_ops = 0  
         self._res_buf   = [] 
         self._aux_buf   = []
-        self.log.debug("Opening cycle, %u Ops" % self._op_cnt)
+        self.log.debug("Opening cycle, %u Ops", self._op_cnt)
 
 
     @coroutine
@@ -142,7 +142,7 @@ class WishboneMaster(Wishbone):
         #if we don't wait. We don't want to risk that, it could hang the bus
         while self._acked_ops < self._op_cnt:
             if last_acked_ops != self._acked_ops:
-                self.log.debug("Waiting for missing acks: %u/%u" % (self._acked_ops, self._op_cnt) )
+                self.log.debug("Waiting for missing acks: %u/%u", self._acked_ops, self._op_cnt)
             last_acked_ops = self._acked_ops    
             #check for timeout when finishing the cycle            
             count += 1
@@ -171,7 +171,7 @@ class WishboneMaster(Wishbone):
                 if (not (self._timeout is None)):
                     if (count > self._timeout): 
                         raise TestFailure("Timeout of %u clock cycles reached when on stall from slave" % self._timeout)                
-            self.log.debug("Stalled for %u cycles" % count)
+            self.log.debug("Stalled for %u cycles", count)
         raise ReturnValue(count)
 
 
@@ -186,7 +186,7 @@ class WishboneMaster(Wishbone):
             while not self._get_reply():
                 yield clkedge
                 count += 1
-            self.log.debug("Waited %u cycles for acknowledge" % count)
+            self.log.debug("Waited %u cycles for acknowledge", count)
         raise ReturnValue(count)    
 
 
@@ -297,7 +297,7 @@ class WishboneMaster(Wishbone):
                         we  = 0
                         dat = 0
                     yield self._drive(we, op.adr, dat, op.sel, op.idle)
-                    self.log.debug("#%3u WE: %s ADR: 0x%08x DAT: 0x%08x SEL: 0x%1x IDLE: %3u" % (cnt, we, op.adr<<2, dat, op.sel, op.idle))
+                    self.log.debug("#%3u WE: %s ADR: 0x%08x DAT: 0x%08x SEL: 0x%1x IDLE: %3u", cnt, we, op.adr<<2, dat, op.sel, op.idle)
                     cnt += 1
                 yield self._close_cycle()
 
@@ -320,12 +320,12 @@ class WishboneMaster(Wishbone):
     def read(self, adr):
         result = yield self.send_cycle([WBOp(adr>>2)])
         for rec in result:
-            self.log.debug("Result: {}".format(rec))
+            self.log.debug("Result: %s", rec)
         raise ReturnValue(result[-1].datrd)
 
     @coroutine
     def write(self, adr, data):
         result = yield self.send_cycle([WBOp(adr>>2, data)])
         for rec in result:
-            self.log.debug("Result: {}".format(rec))
+            self.log.debug("Result: %s", rec)
         raise ReturnValue(0)
\ No newline at end of file
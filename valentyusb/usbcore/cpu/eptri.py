@@ -4,7 +4,7 @@ from enum import IntEnum
 
 from migen import *
 from migen.genlib import fifo
-from migen.genlib import cdc
+from migen.genlib.cdc import MultiReg, BusSynchronizer
 
 from litex.soc.integration.doc import AutoDoc, ModuleDoc
 from litex.soc.interconnect import stream
@@ -51,6 +51,52 @@ epin_queued: A response is queued and has yet to be acknowledged by the host
 ep_stall: a 32-bit field representing endpoitns to respond with STALL.
 """
 
+def bit_select(o, v, sel):
+    """Drive ``o`` with bit ``sel`` of ``v``.
+
+    This decodes ``sel`` into a plain multiplexer, rather than relying on
+    the synthesizer to reduce ``v >> sel`` from a full barrel shifter.
+    """
+    return Case(sel, {i: o.eq(v[i]) for i in range(len(v))})
+
+def one_hot(o, sel):
+    """Drive ``o`` with a mask that has only bit ``sel`` set.
+
+    Like :func:`bit_select`, this decodes ``sel`` explicitly instead of
+    building ``1 << sel`` as a shifter.
+    """
+    return Case(sel, {i: o.eq(1 << i) for i in range(len(o))})
+
+class TokenDecoder(Module):
+    """Decode the USB core's current token.
+
+    Each handler needs to know which kind of token is being processed.
+    Decoding ``usb_core.tok`` once here lets them share a single set of
+    comparators.
+
+    Attributes
+    ----------
+
+    is_setup : Signal
+        ``1`` if the current token is ``SETUP``.
+
+    is_in : Signal
+        ``1`` if the current token is ``IN``.
+
+    is_out : Signal
+        ``1`` if the current token is ``OUT``.
+    """
+    def __init__(self, usb_core):
+        self.is_setup = Signal()
+        self.is_in = Signal()
+        self.is_out = Signal()
+
+        self.comb += Case(usb_core.tok, {
+            PID.SETUP: self.is_setup.eq(1),
+            PID.IN: self.is_in.eq(1),
+            PID.OUT: self.is_out.eq(1),
+        })
+
 class TriEndpointInterface(Module, AutoCSR, AutoDoc):
     """Implements a CPU interface with three FIFOs:
         * SETUP
@@ -74,7 +120,37 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
     cdc (bool, optional): By default, ``eptri`` assumes that the CSR bus is in
         the same 12 MHz clock domain as the USB stack.  If ``cdc`` is set to
         True, then additional buffers will be placed on the ``.we`` and ``.re``
-        lines to handle this difference.
+        lines to handle this difference.  ``IN_STATUS``, ``IN_LEVEL``,
+        ``OUT_STATUS`` and ``OUT_LEVEL`` are also synchronized into the ``sys``
+        domain.  This covers only those four: ``SETUP_STATUS``, the
+        ``EV_STATUS`` and ``EV_PENDING`` registers, ``NEXT_EV`` and
+        ``IRQ_VECTOR`` are still read straight from the ``usb_12`` domain.
+
+    status_cdc_stages (int, optional): The number of synchronizer stages used
+        for the ``IN`` and ``OUT`` status registers when ``cdc`` is True.  Two
+        is enough for most designs, but this may be increased if the
+        synchronizers prove to be unreliable.
+
+    in_fifo_depth (int, optional): The depth of the ``IN`` FIFO, in bytes.
+        This is the largest ``IN`` packet that can be queued, so it should
+        be at least the largest ``wMaxPacketSize`` of any ``IN`` endpoint.
+
+    out_fifo_depth (int, optional): The depth of the ``OUT`` FIFO, in bytes.
+        A received packet is stored along with its 2-byte CRC16, so this
+        should be at least two more than the largest ``wMaxPacketSize`` of
+        any ``OUT`` endpoint.
+
+    out_buffers (int, optional): The number of ``OUT`` packets that can be
+        received before the CPU has to read any of them.  With the default of
+        one, every ``OUT`` gets a ``NAK`` until ``OUT_EV_PENDING`` is cleared.
+        With more, the device keeps accepting packets into free buffers while
+        the CPU drains the oldest one, as long as the endpoint is enabled again
+        before draining.  Each additional buffer costs another ``OUT`` FIFO.
+
+    registered_response (bool, optional): Register the ``ACK``/``NAK``/``STALL``
+        decision before it reaches the USB core, taking the handlers out of
+        the core's combinational path.  This helps timing on slow parts, at
+        the cost of one extra bit time before the device responds.
 
     Attributes
     ----------
@@ -84,7 +160,8 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         master for you to connect to your desired Wishbone bus.
     """
 
-    def __init__(self, iobuf, debug=False, cdc=False):
+    def __init__(self, iobuf, debug=False, cdc=False, status_cdc_stages=2, in_fifo_depth=64,
+                 out_fifo_depth=66, out_buffers=1, registered_response=False):
 
         self.background = ModuleDoc(title="USB Device Tri-FIFO", body="""
             This is a three-FIFO USB device.  It presents one FIFO each for ``IN``, ``OUT``, and
@@ -120,6 +197,10 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
             Once the data has been transferred, the device will raise an interrupt and you
             can begin re-filling the buffer, or fill it with data for a different endpoint.
 
+            There are two ``IN`` buffers.  Arming one switches ``IN_DATA`` over to the
+            other, so while the host is collecting one packet you can write and arm the
+            next.  ``IN_STATUS.FREE`` indicates whether a buffer is available.
+
             To send an empty packet, avoid writing any data to ``IN_DATA`` and simply write
             the endpoint number to ``IN_CTRL.EPNO``.
 
@@ -250,19 +331,51 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         )
 
         # Handlers
-        self.submodules.setup = setup_handler = ClockDomainsRenamer("usb_12")(SetupHandler(usb_core))
+        self.submodules.tokens = tokens = TokenDecoder(usb_core)
+
+        self.submodules.setup = setup_handler = ClockDomainsRenamer("usb_12")(SetupHandler(usb_core, tokens=tokens))
         self.comb += setup_handler.usb_reset.eq(usb_core.usb_reset)
         ems.append(setup_handler.ev)
 
-        in_handler = ClockDomainsRenamer("usb_12")(InHandler(usb_core))
+        # The IN handler runs in usb_12, but its synchronizers (if any) are
+        # clocked by the CSR bus, which it calls "csr".
+        in_handler = ClockDomainsRenamer({"sys": "usb_12", "csr": "sys"})(
+            InHandler(usb_core, tokens=tokens, depth=in_fifo_depth,
+                      status_cdc=cdc, status_cdc_stages=status_cdc_stages))
         self.submodules.__setattr__("in", in_handler)
         ems.append(in_handler.ev)
 
-        self.submodules.out = out_handler = ClockDomainsRenamer("usb_12")(OutHandler(usb_core))
+        self.submodules.out = out_handler = ClockDomainsRenamer({"sys": "usb_12", "csr": "sys"})(
+            OutHandler(usb_core, tokens=tokens, depth=out_fifo_depth, buffers=out_buffers,
+                       status_cdc=cdc, status_cdc_stages=status_cdc_stages))
+        self.comb += out_handler.usb_reset.eq(usb_core.usb_reset)
         ems.append(out_handler.ev)
 
         self.submodules.ev = ev.SharedIRQ(*ems)
 
+        # CSR addresses follow the order the registers are created in, so
+        # this one is created after every handler's registers.  That keeps
+        # the addresses that existing firmware uses where they were.
+        self.irq_vector = CSRStatus(
+            fields=[
+                CSRField("in", 1, description="``1`` if an ``IN`` event is pending"),
+                CSRField("out", 1, description="``1`` if an ``OUT`` event is pending"),
+                CSRField("setup", 1, description="``1`` if a ``SETUP`` event is pending"),
+                CSRField("reset", 1, description="``1`` if a ``RESET`` event is pending"),
+            ],
+            description="""
+                Every event that is currently pending, in the same bit order as ``NEXT_EV``.
+                This lets an interrupt handler find all of the sources of an IRQ with a
+                single read, rather than reading each ``EV_PENDING`` register in turn.
+            """,
+        )
+        self.comb += [
+            getattr(self.irq_vector.fields, "in").eq(in_handler.ev.packet.pending),
+            self.irq_vector.fields.out.eq(out_handler.ev.packet.pending),
+            self.irq_vector.fields.setup.eq(setup_handler.ev.packet.pending),
+            self.irq_vector.fields.reset.eq(setup_handler.ev.reset.pending),
+        ]
+
         in_next = Signal()
         out_next = Signal()
         self.sync += [
@@ -301,6 +414,33 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         self.comb += usb_core.dtb.eq(in_handler.dtb | debug_packet_detected)
         usb_core_reset = Signal()
 
+        # How to respond to the current token
+        arm = Signal()
+        sta = Signal()
+        if registered_response:
+            # `rdy` holds the USB core in POLL_RESPONSE for an extra cycle,
+            # until the registered response has caught up with the token.
+            poll_d = Signal()
+            self.sync.usb_12 += [
+                usb_core.arm.eq(arm),
+                usb_core.sta.eq(sta),
+                poll_d.eq(usb_core.poll),
+            ]
+            self.comb += usb_core.rdy.eq(poll_d)
+        else:
+            self.comb += [
+                usb_core.arm.eq(arm),
+                usb_core.sta.eq(sta),
+            ]
+
+        # Received data is only used when `data_recv_put` is strobed, so the
+        # payload can go to every handler, and only the strobe is steered
+        # by the state machine.
+        self.comb += [
+            setup_handler.data_recv_payload.eq(usb_core.data_recv_payload),
+            out_handler.data_recv_payload.eq(usb_core.data_recv_payload),
+        ]
+
         self.submodules.stage = stage = ClockDomainsRenamer("usb_12")(ResetInserter()(FSM(reset_state="IDLE")))
         self.comb += stage.reset.eq(usb_core.usb_reset)
 
@@ -315,21 +455,21 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         stage.act("CHECK_TOK",
             If(usb_core.idle,
                 NextState("IDLE"),
-            ).Elif(usb_core.tok == PID.SETUP,
+            ).Elif(tokens.is_setup,
                 NextState("SETUP"),
                 setup_handler.begin.eq(1),
                 in_handler.dtb_reset.eq(1),
                 # SETUP packets must be ACKed unconditionally
-                usb_core.sta.eq(0),
-                usb_core.arm.eq(1),
-            ).Elif(usb_core.tok == PID.IN,
+                sta.eq(0),
+                arm.eq(1),
+            ).Elif(tokens.is_in,
                 NextState("IN"),
-                usb_core.sta.eq(in_handler.stalled),
-                usb_core.arm.eq(in_handler.response),
-            ).Elif(usb_core.tok == PID.OUT,
+                sta.eq(in_handler.stalled),
+                arm.eq(in_handler.response),
+            ).Elif(tokens.is_out,
                 NextState("OUT"),
-                usb_core.sta.eq(out_handler.stalled),
-                usb_core.arm.eq(out_handler.response),
+                sta.eq(out_handler.stalled),
+                arm.eq(out_handler.response),
             ).Else(
                 NextState("IDLE"),
             )
@@ -339,11 +479,11 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
             stage.act("DEBUG",
                 usb_core.data_send_payload.eq(self.debug_bridge.sink_data),
                 usb_core.data_send_have.eq(self.debug_bridge.sink_valid),
-                usb_core.sta.eq(0),
+                sta.eq(0),
                 If(usb_core.endp == 0,
-                    usb_core.arm.eq(self.debug_bridge.send_ack | self.debug_bridge.sink_valid),
+                    arm.eq(self.debug_bridge.send_ack | self.debug_bridge.sink_valid),
                 ).Else(
-                    usb_core.arm.eq(0)
+                    arm.eq(0)
                 ),
                 If(~debug_packet_detected,
                     NextState("IDLE")
@@ -354,14 +494,13 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
 
         stage.act("SETUP",
             # SETUP packet
-            setup_handler.data_recv_payload.eq(usb_core.data_recv_payload),
             setup_handler.data_recv_put.eq(usb_core.data_recv_put),
 
             # We aren't allowed to STALL a SETUP packet
-            usb_core.sta.eq(0),
+            sta.eq(0),
 
             # Always ACK a SETUP packet
-            usb_core.arm.eq(1),
+            arm.eq(1),
 
             If(debug_packet_detected,
                 NextState("DEBUG")
@@ -373,14 +512,14 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         )
 
         stage.act("IN",
-            If(usb_core.tok == PID.IN,
+            If(tokens.is_in,
                 # IN packet (device-to-host)
                 usb_core.data_send_have.eq(in_handler.data_out_have),
                 usb_core.data_send_payload.eq(in_handler.data_out),
                 in_handler.data_out_advance.eq(usb_core.data_send_get),
 
-                usb_core.sta.eq(in_handler.stalled),
-                usb_core.arm.eq(in_handler.response),
+                sta.eq(in_handler.stalled),
+                arm.eq(in_handler.response),
 
                 # After an IN transfer, the host sends an OUT
                 # packet.  We must ACK this and then return to IDLE.
@@ -391,13 +530,12 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
         )
 
         stage.act("OUT",
-            If(usb_core.tok == PID.OUT,
+            If(tokens.is_out,
                 # OUT packet (host-to-device)
-                out_handler.data_recv_payload.eq(usb_core.data_recv_payload),
                 out_handler.data_recv_put.eq(usb_core.data_recv_put),
 
-                usb_core.sta.eq(out_handler.stalled),
-                usb_core.arm.eq(out_handler.response),
+                sta.eq(out_handler.stalled),
+                arm.eq(out_handler.response),
 
                 # After an OUT transfer, the host sends an IN
                 # packet.  We must ACK this and then return to IDLE.
@@ -407,7 +545,22 @@ class TriEndpointInterface(Module, AutoCSR, AutoDoc):
             ),
         )
 
-        self.comb += usb_core.reset.eq(usb_core.error | usb_core_reset)
+        # Reset the USB core on the rising edge of `error`, so that each error
+        # produces a single reset pulse.
+        error_d = Signal()
+        self.sync.usb_12 += error_d.eq(usb_core.error)
+        self.comb += usb_core.reset.eq((usb_core.error & ~error_d) | usb_core_reset)
+
+        # Registers that were added to the handlers after the original layout.
+        # get_csrs() moves them after all of the others, so that the addresses
+        # existing firmware uses stay where they were.
+        self.appended_csrs = [in_handler.level, out_handler.level, out_handler.data32]
+
+    def get_csrs(self, sort=False):
+        csrs = AutoCSR.get_csrs(self, sort)
+        appended = {csr.duid for csr in self.appended_csrs}
+        return ([csr for csr in csrs if csr.duid not in appended] +
+                [csr for csr in csrs if csr.duid in appended])
 
 class SetupHandler(Module, AutoCSR):
     """Handle ``SETUP`` packets
@@ -427,6 +580,17 @@ class SetupHandler(Module, AutoCSR):
     Drain the FIFO by reading from ``SETUP_DATA``, then setting
     ``SETUP_CTRL.ADVANCE``.
 
+    Args
+    ----
+
+    tokens (:obj:`TokenDecoder`, optional): The decoded token type from ``usb_core``,
+        shared with the other handlers.  A new decoder is created if this is ``None``.
+
+    depth (int, optional): The depth of the ``SETUP`` FIFO.  A ``SETUP`` packet
+        is always 8 bytes followed by a 2-byte CRC16, so the default of 10 holds
+        exactly one.  The FIFO is cleared whenever a new ``SETUP`` token arrives,
+        because a new ``SETUP`` aborts whatever control transfer was in progress.
+
     Attributes
     ----------
 
@@ -450,7 +614,9 @@ class SetupHandler(Module, AutoCSR):
 
     """
 
-    def __init__(self, usb_core):
+    def __init__(self, usb_core, tokens=None, depth=10):
+        if tokens is None:
+            self.submodules.tokens = tokens = TokenDecoder(usb_core)
 
         self.reset = Signal()
         self.begin = Signal()
@@ -504,10 +670,12 @@ class SetupHandler(Module, AutoCSR):
 
         class SetupHandlerInner(Module):
             def __init__(self):
-                self.submodules.data = buf = fifo.SyncFIFOBuffered(width=8, depth=10)
+                self.submodules.data = buf = fifo.SyncFIFOBuffered(width=8, depth=depth)
 
                 # Indicates which byte of `SETUP` data we're currently on.
-                data_byte = Signal(4)
+                # This is one-hot, so each byte position is a single bit
+                # rather than a comparison against a counter.
+                data_byte = Signal(8, reset=1)
 
                 # If the incoming `SETUP` token indicates there will be
                 # a DATA stage, this will be set to 1.
@@ -537,7 +705,7 @@ class SetupHandler(Module, AutoCSR):
                     # Advance the FIFO when a byte is read
                     buf.re.eq(data.we),
 
-                    If(usb_core.tok == PID.SETUP,
+                    If(tokens.is_setup,
                         buf.din.eq(data_recv_payload),
                         buf.we.eq(data_recv_put),
                     ),
@@ -552,19 +720,14 @@ class SetupHandler(Module, AutoCSR):
                     # then there will be a Data stage following
                     # this Setup stage.
                     If(data_recv_put,
-                        If(data_byte == 0,
+                        If(data_byte[0],
                             epno.eq(usb_core.endp),
                             is_in.eq(data_recv_payload[7]),
-                        ).Elif(data_byte == 6,
-                            If(data_recv_payload,
-                                have_data_stage.eq(1),
-                            ),
-                        ).Elif(data_byte == 7,
-                            If(data_recv_payload,
-                                have_data_stage.eq(1),
-                            ),
                         ),
-                        data_byte.eq(data_byte + 1),
+                        If((data_byte[6] | data_byte[7]) & (data_recv_payload != 0),
+                            have_data_stage.eq(1),
+                        ),
+                        data_byte.eq(Cat(0, data_byte[:-1])),
                     )
                 ]
 
@@ -591,11 +754,40 @@ class InHandler(Module, AutoCSR):
     To send data, fill the FIFO by writing bytes to ``IN_DATA``.  When you're ready
     to transmit, write the destination endpoint number to ``IN_CTRL``.
 
+    There are two FIFOs.  Queueing a packet with ``IN_CTRL`` switches ``IN_DATA``
+    over to the other FIFO, so the next packet can be written and queued while
+    the first one is waiting to be sent.  ``IN_STATUS.FREE`` is ``1`` whenever
+    there is a FIFO available to write to.
+
+    A ``SETUP`` packet starts a new control transfer, so any packet that is still
+    queued for EP0 is dropped rather than sent as part of the new one.
+
+    Args
+    ----
+
+    tokens (:obj:`TokenDecoder`, optional): The decoded token type from ``usb_core``,
+        shared with the other handlers.  A new decoder is created if this is ``None``.
+
+    depth (int, optional): The depth of each ``IN`` FIFO, in bytes.  Each FIFO
+        holds a single packet, and is cleared once that packet is sent.
+
+    status_cdc (bool, optional): Set this if the CSR bus is not in this module's
+        clock domain.  The ``IN_STATUS`` bits are then synchronized into
+        the ``csr`` clock domain before the CPU can read them.  ``IN_LEVEL``
+        is passed with a handshake, so that all of its bits arrive together.
+        The event registers are not synchronized.
+
+    status_cdc_stages (int, optional): The number of synchronizer stages used
+        when ``status_cdc`` is True.
+
     Attributes
     ----------
 
     """
-    def __init__(self, usb_core):
+    def __init__(self, usb_core, tokens=None, depth=64, status_cdc=False, status_cdc_stages=2):
+        if tokens is None:
+            self.submodules.tokens = tokens = TokenDecoder(usb_core)
+
         self.dtb = Signal()
 
         # Keep track of the current DTB for each of the 16 endpoints
@@ -604,7 +796,13 @@ class InHandler(Module, AutoCSR):
         # A list of endpoints that are stalled
         stall_status = Signal(16)
 
-        self.submodules.data_buf = buf = ResetInserter()(fifo.SyncFIFOBuffered(width=8, depth=64))
+        # Two packet buffers, so the CPU can fill one while the other is
+        # waiting to be sent.  `fill` is the buffer that `IN_DATA` writes to,
+        # and `send` is the buffer sent in response to the next `IN` token.
+        bufs = [ResetInserter()(fifo.SyncFIFOBuffered(width=8, depth=depth)) for _ in range(2)]
+        self.submodules.data_buf0, self.submodules.data_buf1 = bufs
+        fill = Signal()
+        send = Signal()
 
         self.data = CSRStorage(
             fields=[
@@ -614,7 +812,7 @@ class InHandler(Module, AutoCSR):
                 Each byte written into this register gets added to an outgoing FIFO. Any
                 bytes that are written here will be transmitted in the order in which
                 they were added.  The FIFO queue is automatically advanced with each write.
-                The FIFO queue is 64 bytes deep.  If you exceed this amount, the result is undefined."""
+                The FIFO queue is {} bytes deep.  If you exceed this amount, the result is undefined.""".format(depth)
         )
 
         self.ctrl = ctrl = CSRStorage(
@@ -625,13 +823,20 @@ class InHandler(Module, AutoCSR):
             ],
             description="""
                 Enables transmission of data in response to ``IN`` tokens,
-                or resets the contents of the FIFO."""
+                or resets the contents of the FIFO.  There are two FIFOs, and
+                arming one with ``EPNO`` switches ``IN_DATA`` over to the
+                other, so the next packet can be written while this one is
+                being sent.  Arming an endpoint always queues a packet, which
+                is empty if no data was written first.  The exception is a write
+                that clears the stall of an endpoint that already has a packet
+                queued: without any new data, that only clears the stall."""
         )
 
         self.status = CSRStatus(
             fields=[
-                CSRField("idle", description="This value is ``1`` if the packet has finished transmitting."),
-                CSRField("have", offset=4, description="This value is ``0`` if the FIFO is empty."),
+                CSRField("idle", description="This value is ``1`` if all queued packets have finished transmitting."),
+                CSRField("free", description="This value is ``1`` if another packet can be written and queued."),
+                CSRField("have", offset=4, description="This value is ``0`` if the FIFOs are empty."),
                 CSRField("pend", offset=5, description="``1`` if there is an IRQ pending."),
             ],
             description="""
@@ -642,19 +847,26 @@ class InHandler(Module, AutoCSR):
         self.submodules.ev = ev.EventManager()
         self.ev.submodules.packet = ev.EventSourcePulse(name="done", description="""
             Indicates that the host has successfully transferred an ``IN`` packet,
-            and that the FIFO is now empty.
+            and that its FIFO is now empty.
             """)
         self.ev.finalize()
 
+        self.level = CSRStatus(
+            fields=[
+                CSRField("level", len(bufs[0].level), description="The number of bytes in the FIFO."),
+            ],
+            description="""
+                The number of bytes currently written to the ``IN`` FIFO that ``IN_DATA``
+                is adding to.  This can be used to avoid overfilling the FIFO."""
+        )
+
         # Control bits
         ep_stall_mask = Signal(16)
-        self.comb += [
-            ep_stall_mask.eq(1 << ctrl.fields.epno),
-        ]
+        self.comb += one_hot(ep_stall_mask, ctrl.fields.epno)
 
         # Keep track of which endpoints are currently stalled
         self.stalled = Signal()
-        self.comb += self.stalled.eq(stall_status >> usb_core.endp)
+        self.comb += bit_select(self.stalled, stall_status, usb_core.endp)
         self.sync += [
             If(ctrl.fields.reset,
                 stall_status.eq(0),
@@ -671,18 +883,37 @@ class InHandler(Module, AutoCSR):
         #  - 1 - NAK
         self.response = Signal()
 
-        # This value goes "1" when data is pending, and returns to "0" when it's done.
-        queued = Signal()
-        was_queued = Signal()
+        # For each buffer, this goes "1" when its packet is queued, and returns
+        # to "0" when it's done.  `epnos` holds the endpoint it was queued for.
+        queued = Array(Signal() for _ in range(2))
+        epnos = Array(Signal(4) for _ in range(2))
+        send_epno = Signal(4)
+
+        # The DTB bit of the endpoint that the `send` buffer is queued for
+        dtb_mask = Signal(16)
 
         # This goes to "1" when "queued" is 1 when a "start" occurs.  It is used
         # to avoid skipping packets when a packet is queued during a transmission.
         transmitted = Signal()
 
+        # Pulses once a queued packet has been sent
+        done = Signal()
+
+        # Set when a SETUP arrives while the buffer that is next to be sent, or
+        # the one after it, is still queued for EP0
+        drop_send = Signal()
+        drop_next = Signal()
+
+        # Set if `IN_CTRL` is clearing the stall of an endpoint that the other
+        # buffer is already queued for, and nothing has been written to this
+        # one.  Drivers do this to clear a stall, and with a single FIFO it
+        # left the queued packet alone, so it must not queue an empty packet
+        # behind the real one.  Any other write arms the endpoint, so that a
+        # zero-length packet can follow a full one.
+        ctrl_stalled = Signal()
+        unstall_only = Signal()
+
         self.dtb_reset = Signal()
-        self.comb += [
-            buf.reset.eq(ctrl.fields.reset | (usb_core.commit & transmitted & queued)),
-        ]
 
         # Outgoing data will be placed on this signal
         self.data_out = Signal(8)
@@ -697,54 +928,108 @@ class InHandler(Module, AutoCSR):
         is_our_packet = Signal()
         is_in_packet = Signal()
 
+        # Set when the packet in the `send` buffer finishes
+        sent = Signal()
+
         self.comb += [
             # We will respond with "ACK" if the register matches the current endpoint number
-            self.response.eq(queued & is_our_packet & is_in_packet),
-
-            # Wire up the "status" register
-            self.status.fields.have.eq(buf.readable),
-            self.status.fields.idle.eq(~queued),
-            self.status.fields.pend.eq(self.ev.packet.pending),
-
-            # Cause a trigger event when the `queued` value goes to 0
-            self.ev.packet.trigger.eq(~queued & was_queued),
-
-            self.dtb.eq(dtbs >> usb_core.endp),
+            self.response.eq(queued[send] & is_our_packet & is_in_packet),
+
+            # Cause a trigger event when a queued packet has been sent
+            self.ev.packet.trigger.eq(done),
+
+            bit_select(self.dtb, dtbs, usb_core.endp),
+
+            send_epno.eq(epnos[send]),
+            one_hot(dtb_mask, send_epno),
+            is_our_packet.eq(usb_core.endp == send_epno),
+            is_in_packet.eq(tokens.is_in),
+            sent.eq(usb_core.commit & transmitted & self.response & ~self.stalled),
+            drop_send.eq(self.dtb_reset & queued[send] & (epnos[send] == 0)),
+            drop_next.eq(self.dtb_reset & queued[~send] & (epnos[~send] == 0)),
+            bit_select(ctrl_stalled, stall_status, ctrl.fields.epno),
+            unstall_only.eq(ctrl_stalled & queued[~fill] & (epnos[~fill] == ctrl.fields.epno) &
+                            ~Mux(fill, bufs[1].readable, bufs[0].readable)),
+
+            self.data_out.eq(Mux(send, bufs[1].dout, bufs[0].dout)),
+            self.data_out_have.eq(Mux(send, bufs[1].readable, bufs[0].readable)),
+        ]
+        for i, buf in enumerate(bufs):
+            self.comb += [
+                buf.reset.eq(ctrl.fields.reset | (usb_core.commit & transmitted & queued[send] & (send == i)) |
+                             Mux(send == i, drop_send, drop_next)),
+                buf.re.eq(self.data_out_advance & is_in_packet & is_our_packet & (send == i)),
+                buf.we.eq(self.data.re & (fill == i)),
+                buf.din.eq(self.data.storage),
+            ]
 
-            self.data_out.eq(buf.dout),
-            self.data_out_have.eq(buf.readable),
-            buf.re.eq(self.data_out_advance & is_in_packet & is_our_packet),
-            buf.we.eq(self.data.re),
-            buf.din.eq(self.data.storage),
-            is_our_packet.eq(usb_core.endp == ctrl.fields.epno),
-            is_in_packet.eq(usb_core.tok == PID.IN),
+        # Wire up the "status" register
+        status = [
+            (bufs[0].readable | bufs[1].readable, self.status.fields.have),
+            (~queued[0] & ~queued[1], self.status.fields.idle),
+            (~queued[fill], self.status.fields.free),
+            (self.ev.packet.pending, self.status.fields.pend),
         ]
+        fill_level = Mux(fill, bufs[1].level, bufs[0].level)
+        if status_cdc:
+            for i, o in status:
+                self.specials += MultiReg(i, o, odomain="csr", n=status_cdc_stages)
+            self.submodules.level_cdc = level_cdc = BusSynchronizer(len(self.level.fields.level), "sys", "csr")
+            self.comb += [
+                level_cdc.i.eq(fill_level),
+                self.level.fields.level.eq(level_cdc.o),
+            ]
+        else:
+            self.comb += [o.eq(i) for i, o in status]
+            self.comb += self.level.fields.level.eq(fill_level)
 
         self.sync += [
+            done.eq(0),
+            If(ctrl.fields.reset,
+                queued[0].eq(0),
+                queued[1].eq(0),
+                fill.eq(0),
+                send.eq(0),
+            # Drop the EP0 packets, and close up the gap so that `send` is the
+            # oldest packet left and `fill` is the first free buffer.
+            ).Elif(drop_send | drop_next,
+                If(drop_send,
+                    queued[send].eq(0),
+                    send.eq(~send),
+                ),
+                If(drop_next,
+                    queued[~send].eq(0),
+                    fill.eq(~send),
+                ),
+            # When the user updates the `ctrl` register, queue the buffer that
+            # was being filled and start filling the other one.
+            ).Elif(ctrl.re & ~ctrl.fields.stall & ~queued[fill] & ~unstall_only,
+                queued[fill].eq(1),
+                epnos[fill].eq(ctrl.fields.epno),
+                fill.eq(~fill),
+            ),
+
             If(ctrl.fields.reset,
-                queued.eq(0),
-                was_queued.eq(0),
                 transmitted.eq(0),
                 dtbs.eq(0x0001),
             ).Elif(self.dtb_reset,
                 dtbs.eq(dtbs | 1),
-            )
-            # When the user updates the `ctrl` register, enable writing.
-            .Elif(ctrl.re & ~ctrl.fields.stall,
-                queued.eq(1),
+                If(drop_send,
+                    transmitted.eq(0),
+                ),
             )
             .Elif(usb_core.poll & self.response,
                 transmitted.eq(1),
             )
             # When the USB core finishes operating on this packet,
-            # de-assert the queue flag
-            .Elif(usb_core.commit & transmitted & self.response & ~self.stalled,
-                queued.eq(0),
+            # de-assert its queue flag and move on to the other buffer
+            .Elif(sent,
+                queued[send].eq(0),
+                send.eq(~send),
                 transmitted.eq(0),
+                done.eq(1),
                 # Toggle the "DTB" line if we transmitted data
-                dtbs.eq(dtbs ^ (1 << ctrl.fields.epno)),
-            ).Else(
-                was_queued.eq(queued),
+                dtbs.eq(dtbs ^ dtb_mask),
             ),
         ]
 
@@ -758,16 +1043,65 @@ class OutHandler(Module, AutoCSR):
 
     To enable receiving data, write a ``1`` to the ``OUT_CTRL.ENABLE`` bit.
 
-    To drain the FIFO, read from ``OUT.DATA``.  Don't forget to re-
-    enable the FIFO by ensuring ``OUT_CTRL.ENABLE`` is set after advancing the FIFO!
+    To drain the FIFO, read from ``OUT.DATA``, or from ``OUT.DATA32`` to take four
+    bytes at a time.  Don't forget to re-enable the FIFO by ensuring
+    ``OUT_CTRL.ENABLE`` is set after advancing the FIFO!
+
+    Args
+    ----
+
+    tokens (:obj:`TokenDecoder`, optional): The decoded token type from ``usb_core``,
+        shared with the other handlers.  A new decoder is created if this is ``None``.
+
+    depth (int, optional): The depth of each ``OUT`` FIFO, in bytes.  A FIFO
+        holds one packet at a time, including its 2-byte CRC16.
+
+    buffers (int, optional): The number of ``OUT`` FIFOs.  With more than one,
+        the next packet is received into a free FIFO while the CPU is still
+        reading the previous one, instead of getting a ``NAK``.
+
+    status_cdc (bool, optional): Set this if the CSR bus is not in this module's
+        clock domain.  The ``OUT_STATUS`` bits are then synchronized into
+        the ``csr`` clock domain before the CPU can read them.  ``EPNO`` and
+        ``OUT_LEVEL`` are passed with a handshake, so that all of their bits
+        arrive together.  The event registers are not synchronized.
+
+    status_cdc_stages (int, optional): The number of synchronizer stages used
+        for the single-bit ``OUT_STATUS`` fields when ``status_cdc`` is True.
 
     Attributes
     ----------
 
     """
-    def __init__(self, usb_core):
-
-        self.submodules.data_buf = buf = ResetInserter()(fifo.SyncFIFOBuffered(width=8, depth=66))
+    def __init__(self, usb_core, tokens=None, depth=66, buffers=1, status_cdc=False,
+                 status_cdc_stages=2):
+        if tokens is None:
+            self.submodules.tokens = tokens = TokenDecoder(usb_core)
+
+        # Received bytes are packed into words of up to four bytes before going
+        # into the FIFO, so that `OUT_DATA32` always has a whole word to read.
+        # Each entry is the word along with the number of bytes in it.
+        bufs = [ResetInserter()(fifo.SyncFIFOBuffered(width=32+3, depth=(depth + 3)//4))
+                for _ in range(buffers)]
+        for i, buf in enumerate(bufs):
+            setattr(self.submodules, "data_buf{}".format(i), buf)
+        # Wide enough to count a full FIFO's worth of bytes, which is a little
+        # more than `depth` once it has been rounded up to whole words.
+        level_bits = len(bufs[0].level) + 2
+
+        # The FIFOs form a ring of packet buffers.  The USB core fills `tail`,
+        # the CPU reads from `head`, and `count` is how many hold a packet.
+        head = Signal(max=max(buffers, 2))
+        tail = Signal(max=max(buffers, 2))
+        count = Signal(max=buffers + 1)
+        top = Signal(32+3)
+        readable = Signal()
+        self.comb += [
+            top.eq(Array(buf.dout for buf in bufs)[head]),
+            readable.eq(Array(buf.readable for buf in bufs)[head]),
+        ]
+        top_word = top[:32]
+        top_count = top[32:]
 
         self.data = data = CSRStatus(
             fields=[
@@ -776,7 +1110,8 @@ class OutHandler(Module, AutoCSR):
             description="""
                 Data received from the host will go into a FIFO.  This register
                 reflects the contents of the top byte in that FIFO.  Reading from
-                this register advances the FIFO pointer."""
+                this register advances the FIFO pointer.  The FIFO is {} bytes deep,
+                which includes the two CRC16 bytes at the end of each packet.""".format(depth)
         )
 
         self.ctrl = ctrl = CSRStorage(
@@ -789,7 +1124,8 @@ class OutHandler(Module, AutoCSR):
             description="""
                 Controls for receiving packet data.  To enable an endpoint, write its value to ``epno``,
                 with the ``enable`` bit set to ``1`` to enable an endpoint, or ``0`` to disable it.
-                Resetting the OutHandler will set all ``enable`` bits to 0.
+                Resetting the OutHandler will set all ``enable`` bits to 0,
+                and throw away any packets waiting in the FIFOs along with their ``done`` event.
 
                 Similarly, you can adjust the ``STALL`` state by setting or clearing the ``stall`` bit."""
         )
@@ -804,14 +1140,48 @@ class OutHandler(Module, AutoCSR):
         )
 
         self.submodules.ev = ev.EventManager()
-        self.ev.submodules.packet = ev.EventSourcePulse(name="done", description="""
+        self.ev.submodules.packet = ResetInserter()(ev.EventSourcePulse(name="done", description="""
             Indicates that an ``OUT`` packet has successfully been transferred
             from the host.  This bit must be cleared in order to receive
-            additional packets.""")
+            additional packets."""))
         self.ev.finalize()
 
+        self.level = CSRStatus(
+            fields=[
+                CSRField("level", level_bits, description="The number of bytes in the FIFO."),
+            ],
+            description="""
+                The number of bytes waiting in the ``OUT`` FIFO, including the two CRC16
+                bytes at the end of the packet.  A polling driver can read this once
+                and then drain that many bytes from ``OUT_DATA``."""
+        )
+
+        self.data32 = data32 = CSRStatus(
+            fields=[
+                CSRField("data", 32, description="The top four bytes of the receive FIFO."),
+            ],
+            description="""
+                The next four bytes of the receive FIFO, with the top byte in bits 0-7.
+                Reading this register advances the FIFO by four bytes.  The last word
+                of a packet may hold fewer than four bytes, and the unused high bytes
+                read as ``0``.  Use ``OUT_LEVEL`` to tell how many bytes are left.
+                On a 32-bit CSR bus, this drains the FIFO with a quarter of the reads
+                ``OUT_DATA`` would need.
+
+                If ``OUT_DATA`` has already been read partway into a word, this returns
+                only the rest of that word, so that the two registers may be mixed."""
+        )
+
         self.usb_reset = Signal()
 
+        # A bus reset or `OUT_CTRL.RESET` throws away every packet, along with
+        # the position of the ring and the event for its `head`.
+        ring_reset = Signal()
+        self.comb += [
+            ring_reset.eq(ctrl.fields.reset | self.usb_reset),
+            self.ev.packet.reset.eq(ring_reset),
+        ]
+
         self.stalled = Signal()
         self.enabled = Signal()
         stall_status = Signal(16)
@@ -823,8 +1193,8 @@ class OutHandler(Module, AutoCSR):
             ).Else(
                 ep_mask.eq(1 << ctrl.fields.epno),
             ),
-            self.stalled.eq(stall_status >> usb_core.endp),
-            self.enabled.eq(enable_status >> usb_core.endp),
+            bit_select(self.stalled, stall_status, usb_core.endp),
+            bit_select(self.enabled, enable_status, usb_core.endp),
         ]
         self.sync += [
             If(ctrl.fields.reset | self.usb_reset,
@@ -837,51 +1207,187 @@ class OutHandler(Module, AutoCSR):
             ),
         ]
 
-        # The endpoint number of the most recently received packet
+        # The endpoint number of the packet in each buffer, and of the one
+        # the CPU is reading
+        epnos = Array(Signal(4) for _ in range(buffers))
         epno = Signal(4)
+        self.comb += epno.eq(epnos[head])
 
         # How to respond to requests:
         #  - 1 - ACK
         #  - 0 - NAK
-        # Send a NAK if the buffer contains data, or if "ENABLE" has not been set.
+        # Send a NAK if every buffer holds a packet, or if "ENABLE" has not been set.
         self.response = Signal()
         responding = Signal()
         is_out_packet = Signal()
 
         # Keep track of whether we're currently responding.
-        self.comb += is_out_packet.eq(usb_core.tok == PID.OUT)
-        self.comb += self.response.eq(self.enabled & is_out_packet & ~self.ev.packet.pending)
-        self.sync += If(usb_core.poll, responding.eq(self.response))
+        self.comb += is_out_packet.eq(tokens.is_out)
+        self.comb += self.response.eq(self.enabled & is_out_packet & (count != buffers))
+        self.sync += [
+            If(ring_reset,
+                responding.eq(0),
+            ).Elif(usb_core.poll,
+                responding.eq(self.response),
+            ),
+        ]
 
-        # Connect the buffer to the USB system
+        # When data is successfully transferred, the buffer becomes full.
+        # This is true even if "no" data was transferred, because the
+        # buffer will then contain two bytes of CRC16 data.
+        # The CPU releases the buffer at `head` by clearing the event, which
+        # is raised again straight away if another packet is waiting.
+        commit = Signal()
+        release = Signal()
+        self.comb += [
+            commit.eq(usb_core.commit & responding),
+            release.eq(self.ev.packet.clear & (count != 0)),
+            self.ev.packet.trigger.eq(
+                (commit & ((count == 0) | (release & (count == 1)))) |
+                (release & (count > 1))),
+        ]
+        self.sync += [
+            If(ring_reset,
+                head.eq(0),
+                tail.eq(0),
+                count.eq(0),
+            ).Else(
+                If(commit,
+                    If(tail == buffers - 1,
+                        tail.eq(0),
+                    ).Else(
+                        tail.eq(tail + 1),
+                    ),
+                ),
+                If(release,
+                    If(head == buffers - 1,
+                        head.eq(0),
+                    ).Else(
+                        head.eq(head + 1),
+                    ),
+                ),
+                count.eq(count + commit - release),
+            ),
+        ]
+
+        # Connect the buffers to the USB system
         self.data_recv_payload = Signal(8)
         self.data_recv_put = Signal()
+
+        # Pack incoming bytes into a word, and push it when it is full or when
+        # the packet finishes.  Each new token starts a fresh word, so the
+        # bytes of a packet that was never committed are not carried over.
+        put = Signal()
+        put_word = Signal(32)
+        put_count = Signal(max=5)
+        push = Signal()
+        push_data = Signal(32+3)
+        self.comb += [
+            put.eq(self.data_recv_put & responding),
+            If(put & (put_count == 3),
+                push_data.eq(Cat(put_word[:24], self.data_recv_payload, 4)),
+                push.eq(1),
+            ).Elif(commit & (put_count != 0),
+                push_data.eq(Cat(put_word, put_count)),
+                push.eq(1),
+            ),
+        ]
+        self.sync += [
+            If(ring_reset | usb_core.poll | push,
+                put_word.eq(0),
+                put_count.eq(0),
+            ).Elif(put,
+                Case(put_count, {i: put_word[8*i:8*(i+1)].eq(self.data_recv_payload) for i in range(3)}),
+                put_count.eq(put_count + 1),
+            ),
+        ]
+
+        # `OUT_DATA` steps through the top word one byte at a time, while
+        # `OUT_DATA32` returns whatever is left of it and pops it at once.
+        # `level` counts the bytes that have made it into the FIFO.
+        offset = Signal(2)
+        levels = [Signal(level_bits) for _ in range(buffers)]
+        level = Signal(level_bits)
+        pop = Signal()
+        popped = Signal(3)
         self.comb += [
-            buf.din.eq(self.data_recv_payload),
-            buf.we.eq(self.data_recv_put & responding),
-            buf.reset.eq(ctrl.fields.reset),
-            self.data.fields.data.eq(buf.dout),
-
-            # When data is read, advance the FIFO
-            buf.re.eq(data.we),
-
-            self.status.fields.epno.eq(epno),
-            self.status.fields.have.eq(buf.readable),
-            self.status.fields.pend.eq(self.ev.packet.pending),
-
-            # When data is successfully transferred, the buffer becomes full.
-            # This is true even if "no" data was transferred, because the
-            # buffer will then contain two bytes of CRC16 data.
-            # Therefore, if the FIFO is readable, an interrupt must be triggered.
-            self.ev.packet.trigger.eq(responding & usb_core.commit),
+            level.eq(Array(levels)[head]),
+            Case(offset, {i: [
+                self.data.fields.data.eq(top_word[8*i:8*(i+1)]),
+                self.data32.fields.data.eq(top_word[8*i:]),
+            ] for i in range(4)}),
+            If(readable,
+                If(data32.we,
+                    popped.eq(top_count - offset),
+                    pop.eq(1),
+                ).Elif(data.we,
+                    popped.eq(1),
+                    pop.eq(offset == top_count - 1),
+                ),
+            ),
         ]
+        for i, buf in enumerate(bufs):
+            # Releasing a buffer throws away whatever the CPU didn't read, so
+            # that it is empty when the ring comes back around to it.  With a
+            # single buffer, the rest of the packet can still be read after
+            # the event has been cleared.
+            if buffers > 1:
+                drop = ring_reset | (release & (head == i))
+            else:
+                drop = ring_reset
+            self.comb += [
+                buf.reset.eq(drop),
+                buf.din.eq(push_data),
+                buf.we.eq(push & (tail == i)),
+                buf.re.eq(pop & (head == i)),
+            ]
+            self.sync += [
+                If(drop,
+                    levels[i].eq(0),
+                ).Else(
+                    levels[i].eq(levels[i] + Mux(buf.we & buf.writable, push_data[32:], 0) - Mux(head == i, popped, 0)),
+                ),
+            ]
+        # With a single buffer, `head` never moves, so releasing it must not
+        # disturb a partly-read word.
+        next_word = (pop | release) if buffers > 1 else pop
+        self.sync += [
+            If(ring_reset | next_word,
+                offset.eq(0),
+            ).Elif(popped,
+                offset.eq(offset + 1),
+            ),
+        ]
+
+        # Wire up the "status" register
+        status = [
+            (readable, self.status.fields.have),
+            (self.ev.packet.pending, self.status.fields.pend),
+        ]
+        if status_cdc:
+            for i, o in status:
+                self.specials += MultiReg(i, o, odomain="csr", n=status_cdc_stages)
+            self.submodules.epno_cdc = epno_cdc = BusSynchronizer(len(epno), "sys", "csr")
+            self.submodules.level_cdc = level_cdc = BusSynchronizer(len(self.level.fields.level), "sys", "csr")
+            self.comb += [
+                epno_cdc.i.eq(epno),
+                self.status.fields.epno.eq(epno_cdc.o),
+                level_cdc.i.eq(level),
+                self.level.fields.level.eq(level_cdc.o),
+            ]
+        else:
+            self.comb += [o.eq(i) for i, o in status]
+            self.comb += [
+                self.status.fields.epno.eq(epno),
+                self.level.fields.level.eq(level),
+            ]
 
         # If we get a packet, turn off the "IDLE" flag and keep it off until the packet has finished.
         self.sync += [
             If(ctrl.fields.reset,
                 enable_status.eq(0),
             ).Elif(usb_core.commit & responding,
-                epno.eq(usb_core.endp),
+                epnos[tail].eq(usb_core.endp),
                 # Disable this EP when a transfer finishes
                 enable_status.eq(enable_status & ~ep_mask),
                 responding.eq(0),
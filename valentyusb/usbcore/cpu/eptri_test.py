@@ -7,13 +7,13 @@ from migen import *
 
 from ..endpoint import EndpointType, EndpointResponse
 from ..io_test import FakeIoBuf
-from ..pid import PIDTypes
+from ..pid import PID, PIDTypes
 from ..utils.packet import crc16
 
 from ..test.common import BaseUsbTestCase, CommonUsbTestCase
 from ..test.clock import CommonTestMultiClockDomain
 
-from .eptri import TriEndpointInterface
+from .eptri import TriEndpointInterface, InHandler, OutHandler
 
 
 class TestTriEndpointInterface(
@@ -263,5 +263,486 @@ class TestTriEndpointInterface(
         return bool(status)
 
 
+class FakeUsbCore:
+    """The ``usb_core`` signals that the endpoint handlers look at."""
+    def __init__(self):
+        self.tok = Signal(4)
+        self.endp = Signal(4)
+        self.setup = Signal()
+        self.poll = Signal()
+        self.commit = Signal()
+
+
+class HandlerTestCase(unittest.TestCase):
+    """Runs a single endpoint handler against a `FakeUsbCore`."""
+
+    def make_dut(self, handler, **kwargs):
+        self.usb_core = FakeUsbCore()
+        self.dut = handler(self.usb_core, **kwargs)
+        # CSRs aren't submodules of their handler, and can only be finalized
+        # by a CSR bank.  Pull in just the logic that connects their fields,
+        # and drive `storage`, `re` and `we` directly.
+        for csr in self.dut.get_csrs():
+            self.dut.comb += csr._fragment.comb
+
+    def run_sim(self, stim):
+        run_simulation(self.dut, stim())
+
+    def write_ctrl(self, value):
+        yield self.dut.ctrl.storage.eq(value)
+        yield self.dut.ctrl.re.eq(1)
+        yield
+        yield self.dut.ctrl.re.eq(0)
+        yield
+
+    def clear_pending(self):
+        yield self.dut.ev.pending.r.eq(0xff)
+        yield self.dut.ev.pending.re.eq(1)
+        yield
+        yield self.dut.ev.pending.re.eq(0)
+        yield
+
+
+class TestInHandler(HandlerTestCase):
+
+    def setUp(self):
+        self.make_dut(InHandler)
+
+    def write_data(self, data):
+        for v in data:
+            yield self.dut.data.storage.eq(v)
+            yield self.dut.data.re.eq(1)
+            yield
+        yield self.dut.data.re.eq(0)
+        yield
+
+    def host_in(self, epno):
+        """Send an ``IN`` token, and return the data if it was ``ACK``-ed."""
+        usb_core = self.usb_core
+        yield usb_core.tok.eq(PID.IN)
+        yield usb_core.endp.eq(epno)
+        yield
+        if not (yield self.dut.response):
+            yield usb_core.tok.eq(0)
+            yield
+            return None
+        yield usb_core.poll.eq(1)
+        yield
+        yield usb_core.poll.eq(0)
+        yield
+        data = []
+        while (yield self.dut.data_out_have):
+            data.append((yield self.dut.data_out))
+            yield self.dut.data_out_advance.eq(1)
+            yield
+            yield self.dut.data_out_advance.eq(0)
+            yield
+        yield usb_core.commit.eq(1)
+        yield
+        yield usb_core.commit.eq(0)
+        yield usb_core.tok.eq(0)
+        yield
+        yield
+        return data
+
+    def test_queue_two_packets(self):
+        def stim():
+            yield from self.write_data([1, 2])
+            yield from self.write_ctrl(1)
+            yield from self.write_data([3])
+            yield from self.write_ctrl(1)
+            self.assertEqual((yield from self.host_in(1)), [1, 2])
+            self.assertEqual((yield from self.host_in(1)), [3])
+            self.assertIsNone((yield from self.host_in(1)))
+        self.run_sim(stim)
+
+    def test_dtb_toggle(self):
+        # Each packet sent flips the DTB of its endpoint, including packets
+        # that were queued back to back.
+        def stim():
+            yield from self.write_data([1])
+            yield from self.write_ctrl(1)
+            yield from self.write_data([2])
+            yield from self.write_ctrl(1)
+            yield self.usb_core.endp.eq(1)
+            yield
+            self.assertFalse((yield self.dut.dtb))
+            self.assertEqual((yield from self.host_in(1)), [1])
+            self.assertTrue((yield self.dut.dtb))
+            self.assertTrue((yield self.dut.status.fields.pend))
+            yield from self.clear_pending()
+            self.assertEqual((yield from self.host_in(1)), [2])
+            self.assertFalse((yield self.dut.dtb))
+            self.assertTrue((yield self.dut.status.fields.pend))
+        self.run_sim(stim)
+
+    def test_reset(self):
+        # IN_CTRL.RESET empties and frees both buffers.
+        def stim():
+            yield from self.write_data([1, 2])
+            yield from self.write_ctrl(0)
+            yield from self.write_data([3])
+            yield from self.write_ctrl(0)
+            yield from self.write_ctrl(0x20)
+            self.assertTrue((yield self.dut.status.fields.idle))
+            self.assertTrue((yield self.dut.status.fields.free))
+            self.assertFalse((yield self.dut.status.fields.have))
+            self.assertIsNone((yield from self.host_in(0)))
+            yield from self.write_data([4])
+            yield from self.write_ctrl(0)
+            self.assertEqual((yield from self.host_in(0)), [4])
+        self.run_sim(stim)
+
+    def test_zlp_after_full_packet(self):
+        # A transfer that is a whole number of packets long ends with a
+        # zero-length packet, which is armed behind the last full one.
+        def stim():
+            yield from self.write_data([1, 2, 3, 4])
+            yield from self.write_ctrl(0)
+            self.assertTrue((yield self.dut.status.fields.free))
+            yield from self.write_ctrl(0)
+            self.assertEqual((yield from self.host_in(0)), [1, 2, 3, 4])
+            self.assertEqual((yield from self.host_in(0)), [])
+            self.assertIsNone((yield from self.host_in(0)))
+            self.assertTrue((yield self.dut.status.fields.idle))
+        self.run_sim(stim)
+
+    def test_unstall_queued(self):
+        # Rewriting IN_CTRL to clear the stall of an endpoint that is already
+        # queued must not queue an empty packet behind it.
+        def stim():
+            yield from self.write_data([7, 7])
+            yield from self.write_ctrl(0)
+            yield from self.write_ctrl(0x40)
+            self.assertTrue((yield self.dut.stalled))
+            yield from self.write_ctrl(0)
+            self.assertFalse((yield self.dut.stalled))
+            self.assertEqual((yield from self.host_in(0)), [7, 7])
+            self.assertIsNone((yield from self.host_in(0)))
+            self.assertTrue((yield self.dut.status.fields.idle))
+        self.run_sim(stim)
+
+    def setup(self):
+        """Pulse `dtb_reset`, as a ``SETUP`` token does."""
+        yield self.dut.dtb_reset.eq(1)
+        yield
+        yield self.dut.dtb_reset.eq(0)
+        yield
+
+    def test_setup_drops_queued(self):
+        # Zero-length packets still waiting from the last control transfer
+        # must not be sent ahead of the data for the new one.
+        def stim():
+            yield from self.write_ctrl(0)
+            yield from self.write_ctrl(0)
+            self.assertFalse((yield self.dut.status.fields.free))
+            yield from self.setup()
+            self.assertTrue((yield self.dut.status.fields.idle))
+            yield from self.write_data([1, 2])
+            yield from self.write_ctrl(0)
+            self.assertEqual((yield from self.host_in(0)), [1, 2])
+            self.assertIsNone((yield from self.host_in(0)))
+        self.run_sim(stim)
+
+    def test_setup_keeps_other_endpoints(self):
+        # Only packets for EP0 are dropped, and the queue stays in order.
+        def stim():
+            yield from self.write_data([1])
+            yield from self.write_ctrl(0)
+            yield from self.write_data([2])
+            yield from self.write_ctrl(1)
+            yield from self.setup()
+            self.assertTrue((yield self.dut.status.fields.free))
+            yield from self.write_data([3])
+            yield from self.write_ctrl(0)
+            self.assertIsNone((yield from self.host_in(0)))
+            self.assertEqual((yield from self.host_in(1)), [2])
+            self.assertEqual((yield from self.host_in(0)), [3])
+            self.assertTrue((yield self.dut.status.fields.idle))
+        self.run_sim(stim)
+
+class TestOutHandler(HandlerTestCase):
+
+    def setUp(self):
+        self.make_dut(OutHandler)
+
+    def host_out(self, epno, data, commit=True):
+        """Send an ``OUT`` packet, and return ``True`` if it was ``ACK``-ed."""
+        usb_core = self.usb_core
+        yield usb_core.tok.eq(PID.OUT)
+        yield usb_core.endp.eq(epno)
+        yield
+        response = (yield self.dut.response)
+        yield usb_core.poll.eq(1)
+        yield
+        yield usb_core.poll.eq(0)
+        for v in data:
+            yield self.dut.data_recv_payload.eq(v)
+            yield self.dut.data_recv_put.eq(1)
+            yield
+            yield self.dut.data_recv_put.eq(0)
+            yield
+        if commit:
+            yield usb_core.commit.eq(1)
+            yield
+            yield usb_core.commit.eq(0)
+        yield usb_core.tok.eq(0)
+        yield
+        yield
+        return bool(response)
+
+    def read_data32(self):
+        """Drain the FIFO through ``OUT_DATA32``."""
+        data = []
+        while (yield self.dut.status.fields.have):
+            word = (yield self.dut.data32.status)
+            count = (yield self.dut.level.fields.level)
+            data.extend((word >> (8*i)) & 0xff for i in range(min(count, 4)))
+            yield self.dut.data32.we.eq(1)
+            yield
+            yield self.dut.data32.we.eq(0)
+            yield
+        return data
+
+    def test_aborted_packet(self):
+        # Bytes from a packet that never got committed must not end up in
+        # the word that the next packet starts.
+        def stim():
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [9, 9], commit=False)))
+            self.assertTrue((yield from self.host_out(0, [1, 2, 3, 4, 5])))
+            self.assertEqual((yield self.dut.level.fields.level), 5)
+            self.assertEqual((yield from self.read_data32()), [1, 2, 3, 4, 5])
+            self.assertEqual((yield self.dut.level.fields.level), 0)
+        self.run_sim(stim)
+
+    def test_level_overflow(self):
+        # `OUT_LEVEL` only counts the bytes that fit in the FIFO, and a full
+        # FIFO doesn't wrap it around.  At a depth of 13, the FIFO holds more
+        # than 15 bytes.
+        for depth in (8, 13):
+            with self.subTest(depth=depth):
+                self.make_dut(OutHandler, depth=depth)
+                def stim():
+                    yield from self.write_ctrl(0x10)
+                    yield from self.host_out(0, list(range(1, 31)))
+                    level = (yield self.dut.level.fields.level)
+                    self.assertGreaterEqual(level, depth)
+                    data = yield from self.read_data32()
+                    self.assertEqual(len(data), level)
+                    self.assertEqual(data, list(range(1, level + 1)))
+                self.run_sim(stim)
+
+    def test_ring(self):
+        # With two buffers, the second packet is ACKed while the first is
+        # still waiting, and clearing the event moves on to the next one.
+        self.make_dut(OutHandler, buffers=2)
+        def stim():
+            yield from self.write_ctrl(0x11)
+            self.assertTrue((yield from self.host_out(1, [1, 2])))
+            yield from self.write_ctrl(0x12)
+            self.assertTrue((yield from self.host_out(2, [3, 4, 5])))
+            self.assertFalse((yield from self.host_out(2, [6])))
+            self.assertEqual((yield self.dut.status.fields.epno), 1)
+            self.assertEqual((yield from self.read_data32()), [1, 2])
+            yield from self.clear_pending()
+            self.assertTrue((yield self.dut.status.fields.pend))
+            self.assertEqual((yield self.dut.status.fields.epno), 2)
+            self.assertEqual((yield from self.read_data32()), [3, 4, 5])
+            yield from self.clear_pending()
+            self.assertFalse((yield self.dut.status.fields.pend))
+            self.assertFalse((yield self.dut.status.fields.have))
+        self.run_sim(stim)
+
+    def test_release_undrained(self):
+        # A buffer that is released without being read must come back empty
+        # the next time the ring reaches it.
+        self.make_dut(OutHandler, buffers=2)
+        def stim():
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [1, 2, 3, 4, 5, 6])))
+            yield from self.clear_pending()
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [7, 8])))
+            self.assertEqual((yield from self.read_data32()), [7, 8])
+            yield from self.clear_pending()
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [9, 10, 11])))
+            self.assertEqual((yield self.dut.level.fields.level), 3)
+            self.assertEqual((yield from self.read_data32()), [9, 10, 11])
+        self.run_sim(stim)
+
+    def test_reset_ring(self):
+        # OUT_CTRL.RESET drops every buffered packet and its event, and the
+        # ring starts over from the first buffer.
+        self.make_dut(OutHandler, buffers=2)
+        def stim():
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [1, 2])))
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [3, 4])))
+            yield from self.clear_pending()
+            yield from self.write_ctrl(0x20)
+            self.assertFalse((yield self.dut.status.fields.pend))
+            self.assertFalse((yield self.dut.status.fields.have))
+            self.assertEqual((yield self.dut.level.fields.level), 0)
+            yield from self.write_ctrl(0x13)
+            self.assertTrue((yield from self.host_out(3, [5, 6, 7, 8, 9])))
+            self.assertTrue((yield self.dut.status.fields.pend))
+            self.assertEqual((yield self.dut.status.fields.epno), 3)
+            self.assertEqual((yield self.dut.level.fields.level), 5)
+            self.assertEqual((yield from self.read_data32()), [5, 6, 7, 8, 9])
+        self.run_sim(stim)
+
+    def test_usb_reset_ring(self):
+        self.make_dut(OutHandler, buffers=2)
+        def stim():
+            yield from self.write_ctrl(0x10)
+            self.assertTrue((yield from self.host_out(0, [1, 2])))
+            yield self.dut.usb_reset.eq(1)
+            yield
+            yield self.dut.usb_reset.eq(0)
+            yield
+            self.assertFalse((yield self.dut.status.fields.pend))
+            self.assertFalse((yield self.dut.status.fields.have))
+            self.assertEqual((yield self.dut.level.fields.level), 0)
+        self.run_sim(stim)
+
+
+class TestTriEndpointResponse(
+        BaseUsbTestCase,
+        CommonTestMultiClockDomain,
+        unittest.TestCase):
+    """Checks the handshake sent for each token, through the real USB core."""
+
+    registered_response = False
+
+    # The packet helpers from CommonUsbTestCase.  Its tests, and the rest of
+    # its helpers, need per-endpoint registers that eptri doesn't have.
+    idle = CommonUsbTestCase.idle
+    _send_packet = CommonUsbTestCase._send_packet
+    send_token_packet = CommonUsbTestCase.send_token_packet
+    send_data_packet = CommonUsbTestCase.send_data_packet
+    send_handshake = CommonUsbTestCase.send_handshake
+    send_ack = CommonUsbTestCase.send_ack
+    expect_packet = CommonUsbTestCase.expect_packet
+    expect_data_packet = CommonUsbTestCase.expect_data_packet
+    expect_ack = CommonUsbTestCase.expect_ack
+    expect_nak = CommonUsbTestCase.expect_nak
+    expect_stall = CommonUsbTestCase.expect_stall
+    assertMultiLineEqualSideBySide = CommonUsbTestCase.assertMultiLineEqualSideBySide
+
+    def on_usb_48_edge(self):
+        if False:
+            yield
+
+    def on_usb_12_edge(self):
+        if False:
+            yield
+
+    def setUp(self):
+        CommonTestMultiClockDomain.setUp(self, ("usb_12", "usb_48"))
+
+        self.iobuf = FakeIoBuf()
+        self.dut = TriEndpointInterface(self.iobuf, registered_response=self.registered_response)
+        for csr in self.dut.get_csrs():
+            self.dut.comb += csr._fragment.comb
+
+        self.packet_h2d = Signal(1)
+        self.packet_d2h = Signal(1)
+        self.packet_idle = Signal(1)
+
+    def run_sim(self, stim):
+        def padfront():
+            for i in range(6):
+                yield
+            yield from self.idle()
+            yield from stim()
+
+        run_simulation(
+            self.dut,
+            padfront(),
+            clocks={
+                "sys": 2,
+                "usb_48": 8,
+                "usb_12": 32,
+            },
+        )
+
+    def tick_usb48(self):
+        yield from self.wait_for_edge("usb_48")
+
+    def tick_usb12(self):
+        for i in range(0, 4):
+            yield from self.tick_usb48()
+
+    def write_csr(self, csr, value):
+        """Write a CSR, holding `re` across a single ``usb_12`` edge."""
+        yield from self.wait_for_edge("usb_12")
+        yield csr.storage.eq(value)
+        yield csr.re.eq(1)
+        yield from self.wait_for_edge("usb_12")
+        yield csr.re.eq(0)
+
+    def host_in(self, epnum):
+        epaddr = EndpointType.epaddr(epnum, EndpointType.IN)
+        yield from self.send_token_packet(PID.IN, 0, epaddr)
+
+    def host_out(self, epnum, data):
+        epaddr = EndpointType.epaddr(epnum, EndpointType.OUT)
+        yield from self.send_token_packet(PID.OUT, 0, epaddr)
+        yield from self.send_data_packet(PID.DATA0, data)
+
+    def test_in_responses(self):
+        in_handler = getattr(self.dut, "in")
+        def stim():
+            yield from self.host_in(1)
+            yield from self.expect_nak()
+
+            for v in [0x11, 0x22]:
+                yield from self.write_csr(in_handler.data, v)
+            yield from self.write_csr(in_handler.ctrl, 1)
+            yield from self.write_csr(in_handler.ctrl, 0x40 | 3)
+
+            # Only the endpoint that the packet was queued for gets it
+            yield from self.host_in(2)
+            yield from self.expect_nak()
+            yield from self.host_in(3)
+            yield from self.expect_stall()
+            yield from self.host_in(1)
+            yield from self.expect_data_packet(PID.DATA0, [0x11, 0x22])
+            yield from self.send_ack()
+
+            yield from self.host_in(1)
+            yield from self.expect_nak()
+        self.run_sim(stim)
+
+    def test_out_responses(self):
+        def stim():
+            yield from self.host_out(1, [0x33])
+            yield from self.expect_nak()
+
+            yield from self.write_csr(self.dut.out.ctrl, 0x10 | 1)
+            yield from self.write_csr(self.dut.out.ctrl, 0x40 | 2)
+
+            yield from self.host_out(2, [0x44])
+            yield from self.expect_stall()
+            yield from self.host_out(3, [0x55])
+            yield from self.expect_nak()
+            yield from self.host_out(1, [0x66])
+            yield from self.expect_ack()
+            self.assertTrue((yield self.dut.out.ev.packet.pending))
+
+            # The endpoint is disabled again once a packet has been received
+            yield from self.host_out(1, [0x77])
+            yield from self.expect_nak()
+        self.run_sim(stim)
+
+
+class TestTriEndpointRegisteredResponse(TestTriEndpointResponse):
+    """The same checks, with the response registered before the USB core."""
+
+    registered_response = True
+
 if __name__ == '__main__':
     unittest.main()
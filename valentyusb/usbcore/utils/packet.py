@@ -3,6 +3,13 @@
 from ..pid import PID
 from . import CrcMoose3 as crc
 
+try:
+    import crcmod.predefined
+    # crcmod runs the CRC loop in its C extension when it is available.
+    _crc16_native = crcmod.predefined.mkCrcFun('crc-16-usb')
+except ImportError:
+    _crc16_native = None
+
 
 def b(s):
     """Byte string with LSB first into an integer.
@@ -79,15 +86,60 @@ def crc5_sof(v):
     return eval('0b' + bin(reg.getFinalValue() | 0x10000000)[::-1][:5])
 
 
+def _crc16_tables():
+    # One entry per byte value, using the reflected form (0xa001) of the
+    # CRC-16/USB polynomial so the table can be applied a byte at a time.
+    table = []
+    for i in range(256):
+        reg = i
+        for _ in range(8):
+            if reg & 1:
+                reg = (reg >> 1) ^ 0xa001
+            else:
+                reg >>= 1
+        table.append(reg)
+
+    # Slice-by-8: tables[k][i] is the CRC of byte i followed by k zero
+    # bytes, which lets eight input bytes be folded in per iteration.
+    tables = [table]
+    for _ in range(7):
+        prev = tables[-1]
+        tables.append([(v >> 8) ^ table[v & 0xff] for v in prev])
+    return tables
+
+
+_CRC16_TABLES = _crc16_tables()
+
+
 def crc16(input_data):
+    """
+    >>> crc16([])
+    [0, 0]
+    >>> [hex(x) for x in crc16(b"123456789")]
+    ['0xc8', '0xb4']
+    >>> [hex(x) for x in crc16([0x00, 0x01, 0x02, 0x03])]
+    ['0xef', '0x7a']
+    """
     # width=16 poly=0x8005 init=0xffff refin=true refout=true xorout=0xffff check=0xb4c8 residue=0xb001 name="CRC-16/USB"
     # CRC appended low byte first.
-    reg = crc.CrcRegister(crc.CRC16_USB)
-    for d in input_data:
-        assert d <= 0xff, input_data
-        reg.takeWord(d, 8)
-    crc16 = reg.getFinalValue()
-    return [crc16 & 0xff, (crc16 >> 8) & 0xff]
+    if _crc16_native is not None:
+        # bytes() rejects values above 0xff, which covers the check below.
+        reg = _crc16_native(bytes(input_data))
+        return [reg & 0xff, reg >> 8]
+
+    input_data = list(input_data)
+    assert all(d <= 0xff for d in input_data), input_data
+    t0, t1, t2, t3, t4, t5, t6, t7 = _CRC16_TABLES
+    reg = 0xffff
+    end = len(input_data) & ~7
+    for i in range(0, end, 8):
+        d0, d1, d2, d3, d4, d5, d6, d7 = input_data[i:i+8]
+        reg = (t7[(reg ^ d0) & 0xff] ^ t6[((reg >> 8) ^ d1) & 0xff]
+             ^ t5[d2] ^ t4[d3] ^ t3[d4] ^ t2[d5] ^ t1[d6] ^ t0[d7])
+    for d in input_data[end:]:
+        reg = (reg >> 8) ^ t0[(reg ^ d) & 0xff]
+    reg ^= 0xffff
+    return [reg & 0xff, reg >> 8]
 
 
 def nrzi(data, cycles=4, init="J"):